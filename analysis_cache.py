@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    cache_key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+_conn = None
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.ANALYSIS_CACHE_PATH), exist_ok=True)
+        _conn = sqlite3.connect(config.ANALYSIS_CACHE_PATH, check_same_thread=False)
+        _conn.execute(_SCHEMA)
+        _conn.commit()
+    return _conn
+
+def make_key(content, prompt_version, model_name, schema):
+    """
+    Build a cache key from the analyzed content, prompt template version, model and output schema.
+    """
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    schema_fingerprint = json.dumps(
+        {name: getattr(tp, "__name__", str(tp)) for name, tp in schema.__annotations__.items()},
+        sort_keys=True
+    )
+    raw_key = "\n".join([content_hash, str(prompt_version), model_name, schema_fingerprint])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+def get(cache_key):
+    """
+    Return the cached analysis result dict for cache_key, or None.
+    """
+    with _lock:
+        row = _get_conn().execute(
+            "SELECT result FROM analyses WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row is None:
+            _stats["misses"] += 1
+            metrics.incr("cache_misses", "analysis")
+            return None
+        _stats["hits"] += 1
+        metrics.incr("cache_hits", "analysis")
+    return json.loads(row[0])
+
+def put(cache_key, result):
+    """
+    Persist an analysis result dict under cache_key.
+    """
+    with _lock:
+        conn = _get_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO analyses (cache_key, result, created_at) VALUES (?, ?, ?)",
+            (cache_key, json.dumps(result, ensure_ascii=False), time.time())
+        )
+        conn.commit()
+
+def stats():
+    """
+    Return hit/miss counters for this process.
+    """
+    with _lock:
+        return dict(_stats)
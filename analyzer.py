@@ -1,15 +1,20 @@
+import asyncio
 import google.generativeai as genai
 import json
 import logging
 import config
+import gemini_scheduler
+import analysis_cache
+import text_reduce
+import metrics
 import typing_extensions as typing
 import re  # <--- 新增这一行
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
-# Configure Gemini
-if config.GEMINI_API_KEY:
-    genai.configure(api_key=config.GEMINI_API_KEY)
+# 修改 prompt 模板时递增，使旧的分析缓存失效
+PROMPT_VERSION = 1
 
 # Define the output schema for structured generation
 class InvestmentInsight(typing.TypedDict):
@@ -19,25 +24,254 @@ class InvestmentInsight(typing.TypedDict):
     key_insight: str
     category: str
 
-def analyze_content(item):
+# Map step output for one chunk of a long document
+class ChunkSummary(typing.TypedDict):
+    summary: str
+    key_points: list[str]
+
+# Batch mode returns one object per item, matched back by id
+class BatchInvestmentInsight(InvestmentInsight):
+    id: str
+
+REQUIREMENTS = """
+    1. title_en: Original title or cleaned up English title.
+    2. title_cn: Professional Chinese translation of the title.
+    3. summary_cn: A detailed summary in Chinese. Keep professional technical terms in English (e.g., "Transformer", "Wafer", "CoWoS").
+    4. key_insight: The single most important investment takeaway or market implication (in Chinese).
+    5. category: Choose one of [Hardware, Model, App, Infrastructure, Policy].
+"""
+
+def has_footers(item):
+    # 字幕每句一行，不套用网页页脚规则
+    return item.get('source_type') != 'youtube'
+
+def clean_content(item):
+    return text_reduce.strip_noise(item.get('content') or '', has_footers(item))
+
+def prepare_content(item):
+    # 去掉导航、页脚、图片等噪音，超出预算时均匀抽取分块，避免只截取开头
+    return text_reduce.reduce_content(item.get('content') or '', config.ANALYSIS_TOKEN_BUDGET,
+                                      config.ANALYSIS_CHUNK_TOKENS, has_footers(item))
+
+def estimate_tokens(text):
+    # 本地估算 token 数，用于限流和打包
+    return text_reduce.count_tokens(text)
+
+def preferred_model(size_tokens, priority=None):
+    # 缓存按路由规则选中的档位区分，降级到其他档位的结果也记在首选档位下
+    return gemini_scheduler.get_scheduler().preferred_model(size_tokens, priority)
+
+def cache_key_for(item, prepared_content):
+    return analysis_cache.make_key(
+        f"{item['title']}\n{item['source_name']}\n{prepared_content}",
+        PROMPT_VERSION, preferred_model(estimate_tokens(prepared_content), item.get('priority')), InvestmentInsight
+    )
+
+def clean_json_text(raw_text):
     """
-    Analyze content using Gemini to generate an investment summary.
+    Strip Markdown code fences that Gemini sometimes wraps around JSON output.
     """
-    if not config.GEMINI_API_KEY:
-        logger.error("GEMINI_API_KEY not set.")
-        return None
+    raw_text = raw_text.strip() # 获取文本并去除首尾空格
+    
+    # 1. 如果以 ``` 开头，说明有 Markdown 包装
+    if raw_text.startswith("```"):
+        # 使用正则去掉第一行 (例如 ```json)
+        raw_text = re.sub(r"^```[a-zA-Z]*\n", "", raw_text)
+        # 去掉结尾的 ```
+        if raw_text.endswith("```"):
+            raw_text = raw_text[:-3].strip()
+    return raw_text
 
-    content = item.get('content')
-    if not content:
-        return None
+def _generation_config(response_schema):
+    return genai.GenerationConfig(response_mime_type="application/json", response_schema=response_schema)
 
-    logger.info(f"Analyzing content: {item['title']}")
+def request_sizes(prompt, size_tokens):
+    # 返回 (本地估算的 token 数, 用于选择档位的规模)
+    estimated_tokens = estimate_tokens(prompt)
+    return estimated_tokens, size_tokens if size_tokens is not None else estimated_tokens
+
+def generate_json(prompt, response_schema, size_tokens=None, priority=None):
+    """
+    Call Gemini through the key / model-tier scheduler and return the parsed JSON response.
+    size_tokens (default: the prompt size) and priority decide the model tier.
+    """
+    scheduler = gemini_scheduler.get_scheduler()
+    estimated_tokens, size_tokens = request_sizes(prompt, size_tokens)
     
-    # Truncate content if too long (simple safety check, though Gemini context is large)
-    # 1 token ~= 4 chars. 1M tokens is huge, but let's be safe with 100k chars for now to avoid timeouts/costs if not needed.
-    truncated_content = content[:100000] 
+    for attempt in range(scheduler.max_attempts()):
+        slot = scheduler.acquire(size_tokens, estimated_tokens, priority)
+        try:
+            response = slot.get_model().generate_content(prompt, generation_config=_generation_config(response_schema))
+            break
+        except Exception as e:
+            # 被限流的 Key 暂停，下一次尝试会换到其他 Key 或档位
+            if scheduler.should_retry(slot, attempt, e):
+                continue
+            raise
+    
+    return parse_response(slot, response, estimated_tokens)
+
+async def generate_json_async(prompt, response_schema, size_tokens=None, priority=None):
+    """
+    generate_json() for the asyncio mode, using the SDK's generate_content_async.
+    """
+    scheduler = gemini_scheduler.get_scheduler()
+    estimated_tokens, size_tokens = request_sizes(prompt, size_tokens)
+
+    for attempt in range(scheduler.max_attempts()):
+        slot = await scheduler.acquire_async(size_tokens, estimated_tokens, priority)
+        try:
+            response = await slot.get_async_model().generate_content_async(
+                prompt, generation_config=_generation_config(response_schema)
+            )
+            break
+        except Exception as e:
+            if await asyncio.to_thread(scheduler.should_retry, slot, attempt, e):
+                continue
+            raise
+
+    return parse_response(slot, response, estimated_tokens)
+
+def parse_response(slot, response, estimated_tokens):
+    """
+    Record usage of a Gemini response on its slot and return the parsed JSON body.
+    """
+    metrics.incr("llm_requests", slot.model_name)
+    metrics.incr("llm_requests_by_key", slot.name)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        slot.limiter.record_tokens(estimated_tokens, usage.total_token_count)
+        metrics.incr("tokens_in", slot.model_name, usage.prompt_token_count)
+        metrics.incr("tokens_out", slot.model_name, usage.candidates_token_count)
+    
+    # === 新增：数据清洗逻辑 ===
+    raw_text = clean_json_text(response.text)
+    
+    # 打印前200个字符到日志，方便调试（可选）
+    logger.info(f"Cleaned JSON content: {raw_text[:200]}...")
+    
+    try:
+        return json.loads(raw_text)
+    except Exception:
+        # 增加更详细的错误日志
+        logger.error(f"Failed Raw Text: {raw_text}")
+        raise
+
+def needs_map_reduce(item):
+    """
+    Whether the item's content is long enough to be analyzed chunk by chunk.
+    """
+    return config.MAP_REDUCE_ENABLED and estimate_tokens(clean_content(item)) > config.MAP_REDUCE_THRESHOLD_TOKENS
 
-    prompt = f"""
+def chunk_cache_key(chunk):
+    return analysis_cache.make_key(chunk, f"map-{PROMPT_VERSION}", preferred_model(estimate_tokens(chunk)), ChunkSummary)
+
+def chunk_prompt(item, chunk, position, total):
+    return f"""
+    You are a private equity technology investment manager. 
+    The following is part {position} of {total} of "{item['title']}" ({item['source_name']}).
+    Summarize this part in English for a later overall investment analysis.
+    
+    Content Body:
+    {chunk}
+    
+    Requirements:
+    1. summary: A dense summary of this part, keeping names, numbers and technical terms.
+    2. key_points: The most important claims or facts relevant to technology investing.
+    """
+
+def summarize_chunk(item, chunk, position, total):
+    """
+    Map step: summarize one chunk of a long document, using the analysis cache.
+    """
+    cache_key = chunk_cache_key(chunk)
+    cached_result = analysis_cache.get(cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    result = generate_json(chunk_prompt(item, chunk, position, total), ChunkSummary)
+    analysis_cache.put(cache_key, result)
+    return result
+
+async def summarize_chunk_async(item, chunk, position, total):
+    cache_key = chunk_cache_key(chunk)
+    cached_result = await asyncio.to_thread(analysis_cache.get, cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    result = await generate_json_async(chunk_prompt(item, chunk, position, total), ChunkSummary)
+    await asyncio.to_thread(analysis_cache.put, cache_key, result)
+    return result
+
+def split_long_content(item, cleaned_content):
+    chunks = text_reduce.split_chunks(cleaned_content, config.MAP_REDUCE_CHUNK_TOKENS)
+    logger.info(f"Map-reduce analysis for {item['title']}: {len(chunks)} chunks")
+    return chunks
+
+def analyze_long_content(item, cleaned_content):
+    """
+    Map-reduce analysis: summarize chunks concurrently, then combine them into one InvestmentInsight.
+    Chunk summaries are cached, so a retry only redoes the chunks that failed.
+    """
+    chunks = split_long_content(item, cleaned_content)
+
+    with ThreadPoolExecutor(max_workers=config.MAP_REDUCE_MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(summarize_chunk, item, chunk, position, len(chunks))
+            for position, chunk in enumerate(chunks, start=1)
+        ]
+        # 任一分块失败则整体失败；成功的分块已写入缓存
+        summaries = [future.result() for future in futures]
+
+    # 汇总步骤按原文规模路由，长内容仍由高档位模型完成
+    return generate_json(combine_prompt(item, summaries), InvestmentInsight,
+                         size_tokens=estimate_tokens(cleaned_content), priority=item.get('priority'))
+
+async def analyze_long_content_async(item, cleaned_content):
+    """
+    analyze_long_content() for the asyncio mode; at most MAP_REDUCE_MAX_WORKERS chunks run at once.
+    """
+    chunks = split_long_content(item, cleaned_content)
+
+    semaphore = asyncio.Semaphore(config.MAP_REDUCE_MAX_WORKERS)
+
+    async def summarize(chunk, position):
+        async with semaphore:
+            return await summarize_chunk_async(item, chunk, position, len(chunks))
+
+    summaries = await asyncio.gather(*(
+        summarize(chunk, position) for position, chunk in enumerate(chunks, start=1)
+    ))
+    return await generate_json_async(combine_prompt(item, summaries), InvestmentInsight,
+                                     size_tokens=estimate_tokens(cleaned_content), priority=item.get('priority'))
+
+def combine_prompt(item, summaries):
+    """
+    Reduce step prompt: combine chunk summaries into one InvestmentInsight.
+    """
+    parts = []
+    for position, summary in enumerate(summaries, start=1):
+        points = "\n".join(f"    - {point}" for point in summary.get('key_points', []))
+        parts.append(f"""
+    Part {position}:
+    {summary.get('summary', '')}
+{points}
+    """)
+
+    return f"""
+    You are a private equity technology investment manager. 
+    The following are summaries of consecutive parts of one long piece of content.
+    Combine them and generate a structured JSON output for the whole content.
+    
+    Content Title: {item['title']}
+    Content Source: {item['source_name']}
+    {''.join(parts)}
+    Requirements:
+    {REQUIREMENTS}
+    """
+
+def content_prompt(item, prepared_content):
+    return f"""
     You are a private equity technology investment manager. 
     Read the following content and generate a structured JSON output.
     
@@ -45,52 +279,298 @@ def analyze_content(item):
     Content Source: {item['source_name']}
     
     Content Body:
-    {truncated_content}
+    {prepared_content}
     
     Requirements:
-    1. title_en: Original title or cleaned up English title.
-    2. title_cn: Professional Chinese translation of the title.
-    3. summary_cn: A detailed summary in Chinese. Keep professional technical terms in English (e.g., "Transformer", "Wafer", "CoWoS").
-    4. key_insight: The single most important investment takeaway or market implication (in Chinese).
-    5. category: Choose one of [Hardware, Model, App, Infrastructure, Policy].
+    {REQUIREMENTS}
     """
 
+def apply_cached(item, cache_key):
+    """
+    Merge a cached analysis into item and return it, or None on a cache miss.
+    """
+    cached_result = analysis_cache.get(cache_key)
+    if cached_result is None:
+        return None
+    logger.info(f"Analysis cache hit: {item['title']}")
+    item.update(cached_result)
+    return item
+
+def plan_content(item):
+    """
+    Decide how a single item is analyzed: returns (mode, text, cache_key) where mode is
+    'map_reduce' (text is the cleaned content) or 'single' (text is the prepared content),
+    or None if the item cannot be analyzed.
+    """
+    if not config.GEMINI_API_KEYS:
+        logger.error("GEMINI_API_KEY / GEMINI_API_KEYS not set.")
+        return None
+
+    content = item.get('content')
+    if not content:
+        return None
+
+    if needs_map_reduce(item):
+        cleaned_content = clean_content(item)
+        return "map_reduce", cleaned_content, cache_key_for(item, cleaned_content)
+
+    prepared_content = prepare_content(item)
+    return "single", prepared_content, cache_key_for(item, prepared_content)
+
+def start_analysis(item, plan=None):
+    """
+    Shared start of analyze_content(): returns (plan, result) where plan is what is left
+    to run, or None when result (the cached item, or None if the item cannot be analyzed)
+    is final. plan is passed when the caller already missed the analysis cache (batch
+    fallbacks), so the cache is not looked up twice.
+    """
+    if plan is None:
+        plan = plan_content(item)
+        if plan is None:
+            return None, None
+        cached = apply_cached(item, plan[2])
+        if cached is not None:
+            return None, cached
+    logger.info(f"Analyzing content: {item['title']}")
+    return plan, None
+
+def finish_analysis(item, cache_key, result):
+    analysis_cache.put(cache_key, result)
+    
+    # Merge analysis with original item
+    item.update(result)
+    return item
+
+def analysis_failed(item, mode, e):
+    logger.error(f"Gemini {'map-reduce ' if mode == 'map_reduce' else ''}analysis failed for {item['title']}: {e}")
+    return None
+
+def analyze_content(item, plan=None):
+    """
+    Analyze content using Gemini to generate an investment summary.
+    """
+    plan, result = start_analysis(item, plan)
+    if plan is None:
+        return result
+    mode, text, cache_key = plan
+
     try:
-        model = genai.GenerativeModel('gemini-2.5-pro') # Using 2.5 Pro as proxy for "3 Pro"
-        
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.GenerationConfig(
-                response_mime_type="application/json",
-                response_schema=InvestmentInsight
-            )
-        )
-        
-        # === 新增：数据清洗逻辑 ===
-        raw_text = response.text.strip() # 获取文本并去除首尾空格
-        
-        # 1. 如果以 ``` 开头，说明有 Markdown 包装
-        if raw_text.startswith("```"):
-            # 使用正则去掉第一行 (例如 ```json)
-            raw_text = re.sub(r"^```[a-zA-Z]*\n", "", raw_text)
-            # 去掉结尾的 ```
-            if raw_text.endswith("```"):
-                raw_text = raw_text[:-3].strip()
-        
-        # 打印前200个字符到日志，方便调试（可选）
-        logger.info(f"Cleaned JSON content: {raw_text[:200]}...")
-        
-        result = json.loads(raw_text)
-        # ========================
-        
-        # Merge analysis with original item
-        item.update(result)
-        return item
+        if mode == "map_reduce":
+            result = analyze_long_content(item, text)
+        else:
+            result = generate_json(content_prompt(item, text), InvestmentInsight,
+                                   size_tokens=estimate_tokens(text), priority=item.get('priority'))
+        return finish_analysis(item, cache_key, result)
 
     except Exception as e:
-        # 增加更详细的错误日志
-        logger.error(f"Gemini analysis failed for {item['title']}: {e}")
-        if 'raw_text' in locals():
-            logger.error(f"Failed Raw Text: {raw_text}")
+        return analysis_failed(item, mode, e)
+
+async def analyze_content_async(item, plan=None):
+    """
+    analyze_content() for the asyncio mode.
+    """
+    plan, result = await asyncio.to_thread(start_analysis, item, plan)
+    if plan is None:
+        return result
+    mode, text, cache_key = plan
+
+    try:
+        if mode == "map_reduce":
+            result = await analyze_long_content_async(item, text)
+        else:
+            result = await generate_json_async(content_prompt(item, text), InvestmentInsight,
+                                               size_tokens=estimate_tokens(text), priority=item.get('priority'))
+        return await asyncio.to_thread(finish_analysis, item, cache_key, result)
+
+    except Exception as e:
+        return analysis_failed(item, mode, e)
+
+def plan_batches(items):
+    """
+    Split items into batches that fit ANALYSIS_BATCH_TOKEN_BUDGET and ANALYSIS_BATCH_MAX_ITEMS.
+    Items that are too large on their own (or need map-reduce) end up in single-item batches.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for item in items:
+        tokens = estimate_tokens(prepare_content(item))
+        if tokens > config.ANALYSIS_BATCH_TOKEN_BUDGET or needs_map_reduce(item):
+            batches.append([item])
+            continue
+        if current and (current_tokens + tokens > config.ANALYSIS_BATCH_TOKEN_BUDGET
+                        or len(current) >= config.ANALYSIS_BATCH_MAX_ITEMS):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def pending_batch(items, results):
+    """
+    Serve cached items of a batch into results and return the rest as
+    (index, item, prepared_content, cache_key) tuples, or None if analysis is not configured.
+    """
+    if not config.GEMINI_API_KEYS:
+        logger.error("GEMINI_API_KEY / GEMINI_API_KEYS not set.")
         return None
 
+    pending = []
+    for index, item in enumerate(items):
+        content = item.get('content')
+        if not content:
+            continue
+        prepared_content = prepare_content(item)
+        cache_key = cache_key_for(item, prepared_content)
+        cached = apply_cached(item, cache_key)
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending.append((index, item, prepared_content, cache_key))
+    return pending
+
+def batch_prompt(pending):
+    sections = []
+    for index, item, prepared_content, _ in pending:
+        sections.append(f"""
+    === Item id: {index} ===
+    Content Title: {item['title']}
+    Content Source: {item['source_name']}
+    
+    Content Body:
+    {prepared_content}
+    """)
+
+    return f"""
+    You are a private equity technology investment manager. 
+    Read each of the following content items and generate a JSON array with exactly one object per item.
+    Every object must contain the item's id exactly as given.
+    {''.join(sections)}
+    Requirements for each object:
+    0. id: The id of the item it describes.
+    {REQUIREMENTS}
+    """
+
+def batch_priority(pending):
+    priorities = [item['priority'] for _, item, _, _ in pending if item.get('priority') is not None]
+    return max(priorities, default=None)
+
+def apply_batch_result(pending, batch_result, results):
+    """
+    Match a batch response back to the pending items by id. Returns the pending entries
+    missing from the response, which are retried with single-item calls.
+    """
+    by_id = {}
+    for entry in batch_result if isinstance(batch_result, list) else []:
+        if isinstance(entry, dict) and 'id' in entry:
+            by_id[str(entry.pop('id'))] = entry
+
+    missing = []
+    for entry in pending:
+        index, item, _, cache_key = entry
+        result = by_id.get(str(index))
+        if result is None:
+            missing.append(entry)
+            continue
+        analysis_cache.put(cache_key, result)
+        item.update(result)
+        results[index] = item
+    return missing
+
+def single_plan(entry):
+    """
+    plan_content() result for a pending batch entry, whose cache lookup already missed.
+    """
+    _, _, prepared_content, cache_key = entry
+    return "single", prepared_content, cache_key
+
+def batch_request(pending):
+    """
+    Prompt, response schema and priority of the batch request for pending entries.
+    """
+    logger.info(f"Analyzing {len(pending)} items in one batch: {', '.join(item['title'] for _, item, _, _ in pending)}")
+    return batch_prompt(pending), list[BatchInvestmentInsight], batch_priority(pending)
+
+def batch_failed(e):
+    logger.error(f"Gemini batch analysis failed, falling back to single-item calls: {e}")
+    return []
+
+def analyze_batch(items):
+    """
+    Analyze several items with a single Gemini request.
+    Returns a list aligned with items (None where analysis failed). Cached items
+    are served from the analysis cache; single items and items missing from the
+    batch response fall back to analyze_content.
+    """
+    if len(items) == 1:
+        # 单独成批的条目 (包括超长、需要 Map-Reduce 的) 直接按单条分析，只查一次缓存
+        return [analyze_content(items[0])]
+    results = [None] * len(items)
+    pending = pending_batch(items, results) or []
+
+    if len(pending) > 1:
+        prompt, schema, priority = batch_request(pending)
+        try:
+            batch_result = generate_json(prompt, schema, priority=priority)
+        except Exception as e:
+            batch_result = batch_failed(e)
+        pending = apply_batch_result(pending, batch_result, results)
+
+    for entry in pending:
+        results[entry[0]] = analyze_content(entry[1], single_plan(entry))
+    return results
+
+async def analyze_batch_async(items):
+    """
+    analyze_batch() for the asyncio mode; single-item fallbacks run concurrently.
+    """
+    if len(items) == 1:
+        return [await analyze_content_async(items[0])]
+    results = [None] * len(items)
+    pending = await asyncio.to_thread(pending_batch, items, results) or []
+
+    if len(pending) > 1:
+        prompt, schema, priority = batch_request(pending)
+        try:
+            batch_result = await generate_json_async(prompt, schema, priority=priority)
+        except Exception as e:
+            batch_result = batch_failed(e)
+        pending = await asyncio.to_thread(apply_batch_result, pending, batch_result, results)
+
+    analyzed = await asyncio.gather(*(analyze_content_async(entry[1], single_plan(entry)) for entry in pending))
+    for entry, analyzed_item in zip(pending, analyzed):
+        results[entry[0]] = analyzed_item
+    return results
+
+def merge_batches(items, batches, batch_results):
+    """
+    Put per-batch results back in the order of items.
+    """
+    positions = {id(item): index for index, item in enumerate(items)}
+    results = [None] * len(items)
+    for batch, results_of_batch in zip(batches, batch_results):
+        for item, result in zip(batch, results_of_batch):
+            results[positions[id(item)]] = result
+    return results
+
+def analyze_items(items):
+    """
+    Analyze a list of items, packing them into batched requests when ANALYSIS_BATCH_ENABLED.
+    Returns a list aligned with items (None where analysis failed).
+    """
+    if not config.ANALYSIS_BATCH_ENABLED:
+        return [analyze_content(item) for item in items]
+
+    batches = plan_batches(items)
+    return merge_batches(items, batches, [analyze_batch(batch) for batch in batches])
+
+async def analyze_items_async(items):
+    """
+    analyze_items() for the asyncio mode.
+    """
+    if not config.ANALYSIS_BATCH_ENABLED:
+        return list(await asyncio.gather(*(analyze_content_async(item) for item in items)))
+
+    batches = plan_batches(items)
+    return merge_batches(items, batches, await asyncio.gather(*(analyze_batch_async(batch) for batch in batches)))
@@ -0,0 +1,66 @@
+import json
+import os
+import threading
+import time
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_lock = threading.Lock()
+
+def _load():
+    global _cache
+    if _cache is None:
+        try:
+            with open(config.APPLE_FEED_CACHE_PATH, "r", encoding="utf-8") as f:
+                _cache = json.load(f)
+        except FileNotFoundError:
+            _cache = {}
+        except Exception as e:
+            logger.warning(f"Apple feed cache unreadable, starting empty: {e}")
+            _cache = {}
+    return _cache
+
+def _save():
+    os.makedirs(os.path.dirname(config.APPLE_FEED_CACHE_PATH), exist_ok=True)
+    tmp_path = config.APPLE_FEED_CACHE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_cache, f, ensure_ascii=False)
+    os.replace(tmp_path, config.APPLE_FEED_CACHE_PATH)
+
+def lookup(apple_ids):
+    """
+    Split apple_ids into cached resolutions.
+    Returns (fresh, stale, missing): fresh/stale map id -> feed URL, missing is a list of ids.
+    """
+    now = time.time()
+    ttl_seconds = config.APPLE_FEED_TTL_HOURS * 3600
+    fresh, stale, missing = {}, {}, []
+
+    with _lock:
+        cache = _load()
+        for apple_id in apple_ids:
+            entry = cache.get(apple_id)
+            if not entry:
+                missing.append(apple_id)
+            elif now - entry["resolved_at"] < ttl_seconds:
+                fresh[apple_id] = entry["feed_url"]
+            else:
+                stale[apple_id] = entry["feed_url"]
+
+    return fresh, stale, missing
+
+def store(resolved):
+    """
+    Persist a mapping of Apple ID -> feed URL.
+    """
+    if not resolved:
+        return
+    now = time.time()
+    with _lock:
+        cache = _load()
+        for apple_id, feed_url in resolved.items():
+            cache[apple_id] = {"feed_url": feed_url, "resolved_at": now}
+        _save()
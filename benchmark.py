@@ -0,0 +1,555 @@
+import argparse
+import asyncio
+import copy
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import logging
+import resource
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+from unittest import mock
+from xml.sax.saxutils import escape
+
+# 基准测试使用独立的临时状态目录 (seen store、缓存、检查点、运行报告)，必须在导入 config 之前设置
+BENCH_STATE_DIR = tempfile.mkdtemp(prefix="aggregator-bench-")
+os.environ["STATE_DIR"] = BENCH_STATE_DIR
+os.environ["RUN_REPORT_DIR"] = os.path.join(BENCH_STATE_DIR, "reports")
+# 先于各模块配置日志，默认只输出警告，避免刷屏影响计时
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+import config
+import analyzer
+import discovery
+import gemini_scheduler
+import http_client
+import ingest
+import main
+import metrics
+import subtitles
+from smtp_sink import SMTPSink
+
+logger = logging.getLogger("benchmark")
+
+SUBTITLE_URL = "https://subtitles.bench.invalid/{video_id}.vtt"
+_ITEM_ID_RE = re.compile(r'=== Item id: (\S+) ===')
+
+_VOCAB = (
+    "model inference training cluster GPU wafer CoWoS HBM capex margin revenue token latency "
+    "agent workflow enterprise adoption startup valuation compute datacenter power cooling "
+    "transformer benchmark reasoning open-source pricing demand supply roadmap foundry yield"
+).split()
+
+def _normalize_url(url):
+    # 与 requests 发送时的 URL 形式保持一致，作为夹具的键
+    return requests.Request("GET", url).prepare().url
+
+def _words(rng, count):
+    return " ".join(rng.choice(_VOCAB) for _ in range(count))
+
+class Fixtures:
+    """
+    Recorded inputs for one benchmark run: the DATA_SOURCES to replay, HTTP bodies by URL
+    (feeds, iTunes lookups, subtitle files), Firecrawl markdown by article URL and
+    YouTube search results by channel id.
+    """
+    def __init__(self, sources=None):
+        self.sources = sources or {}
+        self.http = {}
+        self.firecrawl = {}
+        self.youtube = {}
+
+    def add_http(self, url, body, headers=None, status=200):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.http[_normalize_url(url)] = (status, dict(headers or {}), body)
+
+    def sizes(self):
+        return {
+            "http_bytes": sum(len(body) for _, _, body in self.http.values()),
+            "articles": len(self.firecrawl),
+            "article_bytes": sum(len(markdown.encode("utf-8")) for markdown in self.firecrawl.values()),
+            "videos": sum(len(videos) for videos in self.youtube.values()),
+        }
+
+    def save(self, directory):
+        """
+        Write the fixtures as manifest.json plus one body file per HTTP response / article.
+        """
+        bodies = os.path.join(directory, "bodies")
+        os.makedirs(bodies, exist_ok=True)
+
+        def write_body(key, data):
+            name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+            with open(os.path.join(bodies, name), "wb") as f:
+                f.write(data)
+            return name
+
+        manifest = {
+            "sources": self.sources,
+            "http": {
+                url: {"status": status, "headers": headers, "file": write_body(url, body)}
+                for url, (status, headers, body) in self.http.items()
+            },
+            "firecrawl": {
+                url: write_body("firecrawl:" + url, markdown.encode("utf-8"))
+                for url, markdown in self.firecrawl.items()
+            },
+            "youtube": self.youtube,
+        }
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        def read_body(name):
+            with open(os.path.join(directory, "bodies", name), "rb") as f:
+                return f.read()
+
+        fixtures = cls(manifest["sources"])
+        for url, entry in manifest["http"].items():
+            fixtures.add_http(url, read_body(entry["file"]), entry["headers"], entry["status"])
+        fixtures.firecrawl = {
+            url: read_body(name).decode("utf-8") for url, name in manifest["firecrawl"].items()
+        }
+        fixtures.youtube = manifest["youtube"]
+        return fixtures
+
+def synthetic_markdown(rng, size_kb):
+    """
+    Article markdown with the navigation / image / footer noise real Firecrawl output has.
+    """
+    parts = ["[Home](/) | [Archive](/archive) | [About](/about) | [Subscribe](/subscribe)", ""]
+    size = 0
+    while size < size_kb * 1024:
+        paragraph = _words(rng, rng.randint(40, 120)).capitalize() + "."
+        parts += [f"## {_words(rng, 4).title()}", "", paragraph, "", "![chart](https://cdn.bench.invalid/chart.png)", ""]
+        size += len(paragraph) + 80
+    parts += ["Share this post", "© 2024 All rights reserved"]
+    return "\n".join(parts)
+
+def synthetic_feed(rng, title, link_prefix, episodes, recent, now):
+    """
+    A podcast-style RSS feed, newest first: `recent` entries inside the lookback window,
+    the rest older, each with a long show-notes description.
+    """
+    items = []
+    for n in range(episodes):
+        if n < recent:
+            published = now - timedelta(hours=6 * (n + 1))
+        else:
+            published = now - timedelta(days=config.LOOKBACK_HOURS // 24 + 1 + n)
+        link = f"{link_prefix}/episode-{episodes - n}"
+        items.append(
+            "<item>"
+            f"<title>{escape(title)} #{episodes - n}: {escape(_words(rng, 6))}</title>"
+            f"<link>{link}</link>"
+            f"<guid isPermaLink=\"false\">{link_prefix}#{episodes - n}</guid>"
+            f"<pubDate>{format_datetime(published)}</pubDate>"
+            f"<description>{escape(_words(rng, 300))}</description>"
+            f"<enclosure url=\"{link}.mp3\" length=\"104857600\" type=\"audio/mpeg\"/>"
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0"><channel>'
+        f"<title>{escape(title)}</title><link>{link_prefix}</link>"
+        + "".join(items)
+        + "</channel></rss>"
+    )
+
+def synthesize(sources=12, episodes=300, recent=2, youtube_channels=2, article_kb=40, subtitle_hours=2, seed=7):
+    """
+    Generate fixtures in memory: RSS and Apple Podcast sources spread over several hosts,
+    one batched iTunes lookup, Firecrawl markdown for every recent entry and rolling
+    auto-caption subtitles for every recent video.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    categories = ["AI Engineering & Tech", "Industry & Hardware", "VC & Business Strategy", "Chinese Tech Insights"]
+    fixtures = Fixtures({category: [] for category in categories})
+
+    apple_results = []
+    for i in range(sources):
+        category = categories[i % len(categories)]
+        name = f"Bench Show {i}"
+        feed_url = f"https://host{i % 5}.bench.invalid/show-{i}/feed.xml"
+        link_prefix = f"https://articles.bench.invalid/show-{i}"
+        if i % 3 == 2:
+            apple_id = str(1000000 + i)
+            fixtures.sources[category].append({"name": name, "apple_id": apple_id, "type": "apple_podcast"})
+            apple_results.append({"collectionId": int(apple_id), "feedUrl": feed_url})
+        else:
+            fixtures.sources[category].append({"name": name, "url": feed_url, "type": "rss"})
+
+        fixtures.add_http(feed_url, synthetic_feed(rng, name, link_prefix, episodes, recent, now),
+                          {"Content-Type": "application/rss+xml; charset=utf-8"})
+        for n in range(recent):
+            fixtures.firecrawl[f"{link_prefix}/episode-{episodes - n}"] = synthetic_markdown(rng, article_kb)
+
+    if apple_results:
+        # discovery 按 DATA_SOURCES 顺序合并查询，URL 中的 id 顺序需一致
+        apple_ids = [
+            source["apple_id"] for category_sources in fixtures.sources.values()
+            for source in category_sources if source["type"] == "apple_podcast"
+        ]
+        fixtures.add_http(
+            f"https://itunes.apple.com/lookup?id={','.join(apple_ids)}&entity=podcast",
+            json.dumps({"resultCount": len(apple_results), "results": apple_results}),
+            {"Content-Type": "application/json"}
+        )
+
+    subtitle_body = subtitles.synthetic_rolling_vtt(subtitle_hours)
+    for c in range(youtube_channels):
+        channel_id = f"UCbench{c}"
+        fixtures.sources[categories[c % len(categories)]].append(
+            {"name": f"Bench Channel {c}", "channel_id": channel_id, "type": "youtube"}
+        )
+        video_id = f"benchvid{c:03d}"
+        fixtures.youtube[channel_id] = [{
+            "id": {"videoId": video_id},
+            "snippet": {"title": f"Bench Channel {c}: {_words(rng, 6)}", "publishedAt": (now - timedelta(hours=12)).isoformat().replace("+00:00", "Z")},
+        }]
+        fixtures.add_http(SUBTITLE_URL.format(video_id=video_id), subtitle_body, {"Content-Type": "text/vtt"})
+
+    return fixtures
+
+def _fixture_response(adapter, request, status, headers, body):
+    raw = HTTPResponse(
+        body=io.BytesIO(body), headers=headers, status=status,
+        preload_content=False, decode_content=True, request_method=request.method
+    )
+    return adapter.build_response(request, raw)
+
+class FixtureAdapter(HTTPAdapter):
+    """
+    Transport adapter that answers from fixtures instead of the network, so the shared
+    session, streaming and response handling in http_client still run for real.
+    """
+    def __init__(self, fixtures, latency=0.0):
+        super().__init__()
+        self.fixtures = fixtures
+        self.latency = latency
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.latency:
+            time.sleep(self.latency)
+        entry = self.fixtures.http.get(request.url)
+        if entry is None:
+            logger.warning(f"No fixture for {request.url}, answering 404.")
+            entry = (404, {}, b"")
+        status, headers, body = entry
+        return _fixture_response(self, request, status, headers, body)
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Transport adapter that performs real requests and stores the decoded responses as fixtures.
+    """
+    def __init__(self, fixtures):
+        super().__init__()
+        self.fixtures = fixtures
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        response = super().send(request, stream=False, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        # 保存解码后的内容，去掉与原始传输相关的头
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key.lower() not in ("content-encoding", "transfer-encoding", "content-length", "connection")
+        }
+        self.fixtures.add_http(request.url, response.content, headers, response.status_code)
+        return _fixture_response(self, request, response.status_code, headers, response.content)
+
+class FakeGeminiModel:
+    """
+    Stand-in for GenerativeModel that answers with schema-shaped JSON after a fixed latency.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, prompt, generation_config=None):
+        time.sleep(self.latency)
+        return self.respond(prompt, generation_config)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await asyncio.sleep(self.latency)
+        return self.respond(prompt, generation_config)
+
+    def respond(self, prompt, generation_config):
+        schema = getattr(generation_config, "response_schema", None)
+        insight = {
+            "title_en": "Benchmark item",
+            "title_cn": "基准测试条目",
+            "summary_cn": "这是基准测试生成的摘要，用于衡量流水线各阶段的吞吐量。" * 8,
+            "key_insight": "基准测试不代表真实的投资观点。",
+            "category": "Infrastructure",
+        }
+        if schema is analyzer.ChunkSummary:
+            payload = {"summary": "Benchmark chunk summary. " * 20, "key_points": ["point one", "point two"]}
+        elif getattr(schema, "__origin__", None) is list:
+            payload = [dict(insight, id=item_id) for item_id in _ITEM_ID_RE.findall(prompt)]
+        else:
+            payload = insight
+        text = json.dumps(payload, ensure_ascii=False)
+        prompt_tokens = analyzer.estimate_tokens(prompt)
+        output_tokens = analyzer.estimate_tokens(text)
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        ))
+
+class FakeFirecrawl:
+    def __init__(self, fixtures, latency):
+        self.fixtures = fixtures
+        self.latency = latency
+
+    def scrape_url(self, url, params=None):
+        time.sleep(self.latency)
+        markdown = self.fixtures.firecrawl.get(url)
+        return {"markdown": markdown} if markdown is not None else {}
+
+class FakeYoutubeDL:
+    """
+    Stand-in for yt_dlp.YoutubeDL that points every video at its fixture subtitle URL.
+    """
+    def __init__(self, opts=None):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=False):
+        video_id = url.split("v=", 1)[-1]
+        return {"requested_subtitles": {"en": {"url": SUBTITLE_URL.format(video_id=video_id), "ext": "vtt"}}}
+
+def fake_youtube_build(fixtures):
+    """
+    Stand-in for googleapiclient.discovery.build serving search results from fixtures.
+    """
+    def build(service, version, developerKey=None):
+        def search_list(**params):
+            items = fixtures.youtube.get(params.get("channelId"), [])
+            return SimpleNamespace(execute=lambda: {"items": copy.deepcopy(items)})
+        return SimpleNamespace(search=lambda: SimpleNamespace(list=search_list))
+    return build
+
+def mount(adapter):
+    session = http_client.get_session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def use_benchmark_settings(fixtures, args):
+    config.DATA_SOURCES = copy.deepcopy(fixtures.sources)
+    config.GEMINI_API_KEY = config.FIRECRAWL_API_KEY = config.YOUTUBE_API_KEY = "benchmark"
+    config.GEMINI_API_KEYS = [f"benchmark-{index}" for index in range(args.gemini_keys)]
+    config.EMAIL_SENDER = "bench-sender@localhost"
+    config.EMAIL_RECIPIENT = "bench-inbox@localhost"
+    config.EMAIL_RECIPIENTS = [f"bench-inbox-{index}@localhost" for index in range(args.recipients)]
+    config.EMAIL_PASSWORD = "benchmark"
+    config.SMTP_STARTTLS = False
+    if not args.real_rate_limits:
+        # 默认测的是代码本身的热路径，而不是 Free Tier 配额
+        config.RATE_LIMITS = {provider: {"rpm": 100000} for provider in config.RATE_LIMITS}
+        config.GEMINI_MODEL_TIERS = [
+            dict(tier, rpm=100000, tpm=None, rpd=None, burst=None) for tier in config.GEMINI_MODEL_TIERS
+        ]
+
+def run(fixtures, args):
+    """
+    Run main.main() end to end against the fixtures and a local SMTP sink; returns the results dict.
+    """
+    use_benchmark_settings(fixtures, args)
+    mount(FixtureAdapter(fixtures, args.http_latency))
+
+    with SMTPSink() as sink, ExitStack() as stack:
+        config.SMTP_HOST, config.SMTP_PORT = sink.address
+        fake_model = lambda api_key, model_name: FakeGeminiModel(args.llm_latency)
+        stack.enter_context(mock.patch.object(gemini_scheduler, "make_model", fake_model))
+        stack.enter_context(mock.patch.object(gemini_scheduler, "make_async_model", fake_model))
+        stack.enter_context(mock.patch.object(ingest, "get_firecrawl_app", lambda: FakeFirecrawl(fixtures, args.firecrawl_latency)))
+        stack.enter_context(mock.patch.object(ingest.yt_dlp, "YoutubeDL", FakeYoutubeDL))
+        # 只保留 yt-dlp 策略，字幕下载和解析走真实代码
+        stack.enter_context(mock.patch.dict(ingest.TRANSCRIPT_STRATEGIES, {"ytdlp": ingest.get_transcript_with_ytdlp}, clear=True))
+        stack.enter_context(mock.patch.object(discovery, "build", fake_youtube_build(fixtures)))
+        stack.enter_context(mock.patch.object(sys, "argv", ["main.py"] + (["--async"] if args.async_mode else [])))
+
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        main.main()
+        wall_seconds = time.perf_counter() - started
+
+        messages = list(sink.messages)
+        smtp_connections = sink.connections
+
+    summary = metrics.summary()
+    counters = summary["counters"]
+    stages = {}
+    for name, stage in summary["stages"].items():
+        wall = stage.get("wall_seconds") or 0
+        stages[name] = {
+            "count": stage["count"],
+            "failed": stage["failed"],
+            "wall_seconds": wall,
+            "items_per_second": round(stage["count"] / wall, 2) if wall else None,
+        }
+    discovery_wall = stages.get("discovery", {}).get("wall_seconds")
+    fetched = sum(counters.get("bytes_fetched", {}).values())
+    if discovery_wall:
+        stages["discovery"]["mb_per_second"] = round(fetched / 1024 / 1024 / discovery_wall, 2)
+
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+        "emails": len(messages),
+        "email_bytes": sum(len(message["data"]) for message in messages),
+        "smtp_connections": smtp_connections,
+        "fixtures": fixtures.sizes(),
+        "stages": stages,
+        "counters": counters,
+    }
+
+def record(directory, args):
+    """
+    Run live discovery and save its HTTP traffic as fixtures. Firecrawl markdown and
+    subtitles for the discovered items are synthesized, so replay needs no API keys.
+    """
+    fixtures = Fixtures(copy.deepcopy(config.DATA_SOURCES))
+    mount(RecordingAdapter(fixtures))
+    items = discovery.discover_content()
+
+    rng = random.Random(args.seed)
+    channels = {
+        source["name"]: source.get("channel_id")
+        for sources in config.DATA_SOURCES.values() for source in sources
+    }
+    subtitle_body = subtitles.synthetic_rolling_vtt(args.subtitle_hours)
+    for item in items:
+        if item.get("source_type") == "youtube":
+            fixtures.youtube.setdefault(channels.get(item["source_name"]), []).append({
+                "id": {"videoId": item["video_id"]},
+                "snippet": {"title": item["title"], "publishedAt": item["published_at"]},
+            })
+            fixtures.add_http(SUBTITLE_URL.format(video_id=item["video_id"]), subtitle_body, {"Content-Type": "text/vtt"})
+        elif ingest.is_article(item):
+            fixtures.firecrawl[item["url"]] = synthetic_markdown(rng, args.article_kb)
+
+    fixtures.save(directory)
+    print(f"Recorded {len(fixtures.http)} HTTP responses and {len(items)} items to {directory}")
+
+def format_results(results):
+    fixtures = results["fixtures"]
+    lines = [
+        f"Wall time: {results['wall_seconds']:.2f}s",
+        f"Peak RSS: {results['peak_rss_mb']:.1f} MB (+{results['rss_growth_mb']:.1f} MB during the run)",
+        f"Fixtures: {fixtures['http_bytes'] / 1024 / 1024:.1f} MB HTTP, {fixtures['articles']} articles, {fixtures['videos']} videos",
+        f"Emails delivered to sink: {results['emails']} ({results['email_bytes'] / 1024:.0f} KB) "
+        f"over {results['smtp_connections']} SMTP connection(s)",
+        f"{'stage':<12}{'count':>7}{'failed':>8}{'wall s':>9}{'items/s':>10}",
+    ]
+    for name, stage in results["stages"].items():
+        rate = f"{stage['items_per_second']:.2f}" if stage["items_per_second"] else "-"
+        extra = f"  {stage['mb_per_second']:.2f} MB/s" if "mb_per_second" in stage else ""
+        lines.append(f"{name:<12}{stage['count']:>7}{stage['failed']:>8}{stage['wall_seconds']:>9.2f}{rate:>10}{extra}")
+    for name, values in sorted(results["counters"].items()):
+        lines.append(f"{name}: " + ", ".join(f"{key}={value:g}" for key, value in sorted(values.items())))
+    return "\n".join(lines)
+
+def compare(results, baseline, tolerance):
+    """
+    Return regressions (wall time or per-stage wall time / peak RSS beyond tolerance) against a baseline run.
+    """
+    checks = [("wall_seconds", results["wall_seconds"], baseline.get("wall_seconds")),
+              ("peak_rss_mb", results["peak_rss_mb"], baseline.get("peak_rss_mb"))]
+    for name, stage in results["stages"].items():
+        checks.append((f"{name}.wall_seconds", stage["wall_seconds"], baseline.get("stages", {}).get(name, {}).get("wall_seconds")))
+
+    regressions = []
+    for name, value, previous in checks:
+        if previous and value > previous * (1 + tolerance):
+            regressions.append(f"{name}: {previous} -> {value} (+{(value / previous - 1) * 100:.0f}%)")
+    return regressions
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark: discovery -> ingest -> analyze -> notify")
+    parser.add_argument("--fixtures", help="Replay fixtures from this directory instead of synthesizing them")
+    parser.add_argument("--save-fixtures", help="Write the synthesized fixtures to this directory")
+    parser.add_argument("--record", help="Record live discovery traffic into this directory and exit")
+    parser.add_argument("--sources", type=int, default=12, help="Synthetic RSS / Apple Podcast sources")
+    parser.add_argument("--episodes", type=int, default=300, help="Entries per synthetic feed")
+    parser.add_argument("--recent", type=int, default=2, help="Entries per feed inside the lookback window")
+    parser.add_argument("--youtube-channels", type=int, default=2)
+    parser.add_argument("--article-kb", type=int, default=40, help="Size of each synthetic article")
+    parser.add_argument("--subtitle-hours", type=float, default=2, help="Length of each synthetic auto-caption track")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--http-latency", type=float, default=0.0, help="Seconds added to every fixture HTTP response")
+    parser.add_argument("--firecrawl-latency", type=float, default=0.1)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--gemini-keys", type=int, default=1, help="Number of Gemini keys the scheduler spreads requests over")
+    parser.add_argument("--recipients", type=int, default=1, help="Number of email recipients")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Benchmark main.py --async")
+    parser.add_argument("--real-rate-limits", action="store_true", help="Keep config.RATE_LIMITS instead of lifting them")
+    parser.add_argument("--json", help="Write the results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against a previous --json result and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+
+    try:
+        if args.record:
+            record(args.record, args)
+            return 0
+
+        if args.fixtures:
+            fixtures = Fixtures.load(args.fixtures)
+        else:
+            fixtures = synthesize(args.sources, args.episodes, args.recent, args.youtube_channels,
+                                  args.article_kb, args.subtitle_hours, args.seed)
+        if args.save_fixtures:
+            fixtures.save(args.save_fixtures)
+
+        results = run(fixtures, args)
+        print(format_results(results))
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            return 1 if regressions else 0
+        return 0
+    finally:
+        shutil.rmtree(BENCH_STATE_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
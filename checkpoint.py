@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import threading
+import time
+import logging
+import config
+import seen_store
+
+logger = logging.getLogger(__name__)
+
+# 每次运行的检查点：discovery.json 保存发现的条目，
+# ingested.jsonl / analyzed.jsonl 按完成顺序追加 (index 为条目在 discovery 结果中的位置)
+_DISCOVERY_FILE = "discovery.json"
+_INGESTED_FILE = "ingested.jsonl"
+_ANALYZED_FILE = "analyzed.jsonl"
+
+_lock = threading.Lock()
+
+def _path(name):
+    return os.path.join(config.CHECKPOINT_DIR, name)
+
+def start(resume):
+    """
+    Prepare the checkpoint directory. Returns the checkpointed discovery items when
+    resuming a recent unfinished run, otherwise clears old state and returns None.
+    """
+    if resume:
+        items = load_discovery()
+        if items is not None:
+            items = _drop_handled(items)
+        if items:
+            logger.info(f"Resuming previous run with {len(items)} discovered items.")
+            return items
+        logger.info("No recent checkpoint to resume, starting a fresh run.")
+
+    shutil.rmtree(config.CHECKPOINT_DIR, ignore_errors=True)
+    os.makedirs(config.CHECKPOINT_DIR, exist_ok=True)
+    return None
+
+def load_discovery():
+    """
+    Return discovery items from a checkpoint younger than CHECKPOINT_MAX_AGE_HOURS, or None.
+    """
+    path = _path(_DISCOVERY_FILE)
+    try:
+        if time.time() - os.path.getmtime(path) > config.CHECKPOINT_MAX_AGE_HOURS * 3600:
+            logger.info("Checkpoint is too old to resume.")
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _drop_handled(items):
+    """
+    Rewrite the checkpoint without the items the seen store no longer wants processed
+    (delivered by the interrupted run, or failed and backing off), so a resumed run
+    does not report them again. Returns the remaining items.
+    """
+    keep = [index for index, item in enumerate(items) if seen_store.should_process(item)]
+    if len(keep) == len(items):
+        return items
+
+    logger.info(f"Checkpoint: dropping {len(items) - len(keep)} items already handled.")
+    positions = {index: position for position, index in enumerate(keep)}
+    for name in (_INGESTED_FILE, _ANALYZED_FILE):
+        _write(name, {
+            positions[index]: item for index, item in _read(name).items() if index in positions
+        })
+    # 保留原修改时间，检查点的有效期仍从原来的 Discovery 算起
+    mtime = os.path.getmtime(_path(_DISCOVERY_FILE))
+    remaining = [items[index] for index in keep]
+    save_discovery(remaining)
+    os.utime(_path(_DISCOVERY_FILE), (mtime, mtime))
+    return remaining
+
+def save_discovery(items):
+    os.makedirs(config.CHECKPOINT_DIR, exist_ok=True)
+    tmp_path = _path(_DISCOVERY_FILE) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(items, f, ensure_ascii=False)
+    os.replace(tmp_path, _path(_DISCOVERY_FILE))
+
+def _append(name, index, item):
+    line = json.dumps({"index": index, "item": item}, ensure_ascii=False)
+    with _lock:
+        with open(_path(name), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def _read(name):
+    entries = {}
+    try:
+        with open(_path(name), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 进程被杀时最后一行可能不完整
+                    continue
+                entries[entry["index"]] = entry["item"]
+    except FileNotFoundError:
+        pass
+    return entries
+
+def _write(name, entries):
+    tmp_path = _path(name) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for index, item in sorted(entries.items()):
+            f.write(json.dumps({"index": index, "item": item}, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, _path(name))
+
+def record_ingested(index, item):
+    _append(_INGESTED_FILE, index, item)
+
+def record_analyzed(index, item):
+    _append(_ANALYZED_FILE, index, item)
+
+def load_progress():
+    """
+    Return (ingested, analyzed) dicts of index -> item recorded by the current run.
+    """
+    return _read(_INGESTED_FILE), _read(_ANALYZED_FILE)
+
+def finish():
+    """
+    Drop the checkpoint once the report has been delivered.
+    """
+    shutil.rmtree(config.CHECKPOINT_DIR, ignore_errors=True)
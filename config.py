@@ -10,11 +10,18 @@ FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_SENDER = os.getenv("EMAIL_SENDER")
 EMAIL_RECIPIENT = os.getenv("EMAIL_RECIPIENT")
+# 多个收件人用逗号分隔写在 EMAIL_RECIPIENTS 中，未设置时使用 EMAIL_RECIPIENT
+EMAIL_RECIPIENTS = [address.strip() for address in os.getenv("EMAIL_RECIPIENTS", "").split(",") if address.strip()] or (
+    [EMAIL_RECIPIENT] if EMAIL_RECIPIENT else []
+)
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY") 
 
 # 指定 Cookies 文件路径
 YOUTUBE_COOKIES_PATH = os.path.join(os.path.dirname(__file__), 'cookies_burner.txt')
 
+# 本地状态目录 (已处理条目索引、缓存等)，GitHub Actions 中通过 cache 持久化
+STATE_DIR = os.getenv("STATE_DIR", os.path.join(os.path.dirname(__file__), '.state'))
+
 DATA_SOURCES = {
     # 1. AI 深度技术与工程
     "AI Engineering & Tech": [
@@ -32,7 +39,9 @@ DATA_SOURCES = {
         {
             "name": "SemiAnalysis",
             "url": "https://newsletter.semianalysis.com/feed", 
-            "type": "rss"
+            "type": "rss",
+            # 优先级权重 (默认 1.0)，预算不足时先处理权重高的源
+            "weight": 1.5
         }
     ],
 
@@ -138,3 +147,188 @@ DATA_SOURCES = {
 
 # 保持 7 天回顾
 LOOKBACK_HOURS = 168
+
+# === RSS 流式解析 ===
+# 边下载边解析，遇到超出回顾窗口的条目即停止读取 (大型播客 Feed 动辄 500+ 期)
+FEED_STREAMING = True
+# 连续遇到多少条过期条目后停止 (容忍置顶的旧预告片等乱序情况)
+FEED_STREAM_STOP_AFTER_OLD = 3
+
+# === Discovery 并发控制 ===
+# 同时抓取的源数量上限
+DISCOVERY_MAX_WORKERS = 8
+# 同一主机 (如 feeds.megaphone.fm / itunes.apple.com) 的并发请求上限
+DISCOVERY_PER_HOST_LIMIT = 2
+# 整个 Discovery 阶段的总耗时预算 (秒)，超时未完成的源会被跳过
+DISCOVERY_BUDGET_SECONDS = 90
+
+# === 已处理条目索引 (seen store) ===
+SEEN_DB_PATH = os.path.join(STATE_DIR, 'seen_items.sqlite3')
+# 失败条目的重试退避：第 n 次失败后等待 SEEN_RETRY_BASE_HOURS * 2^(n-1) 小时
+SEEN_RETRY_BASE_HOURS = 6
+# 超过该失败次数后不再重试
+SEEN_MAX_ATTEMPTS = 5
+
+# === RSS 条件请求缓存 (ETag / Last-Modified) ===
+FEED_CACHE_PATH = os.path.join(STATE_DIR, 'feed_cache.json')
+
+# === Apple ID -> RSS 解析缓存 ===
+APPLE_FEED_CACHE_PATH = os.path.join(STATE_DIR, 'apple_feed_cache.json')
+# 超过 TTL 的解析结果仍会先被使用，同时在后台刷新 (stale-while-revalidate)
+APPLE_FEED_TTL_HOURS = 72
+
+# === 限流 (Token Bucket) ===
+# rpm: 每分钟请求数；tpm: 每分钟 token 数 (可选)；burst: 允许的突发请求数 (默认等于 rpm)
+RATE_LIMITS = {
+    # Gemini 的配额按 Key / 模型档位配置，见 GEMINI_MODEL_TIERS
+    "firecrawl": {"rpm": 10},
+    # YouTube 字幕接口容易 429，保持约每 30 秒一次
+    "youtube": {"rpm": 2, "burst": 1},
+}
+# 收到 429 但没有 Retry-After 时的默认暂停时间 (秒)
+RATE_LIMIT_DEFAULT_BACKOFF_SECONDS = 60
+# 因 429 被限流时的最大重试次数
+RATE_LIMIT_MAX_RETRIES = 2
+
+# === 流水线 (ingest -> analyze) ===
+# 抓取 worker 数 (Firecrawl / 字幕下载)
+PIPELINE_INGEST_WORKERS = 3
+# 分析 worker 数 (受 Gemini 限流约束)，None 表示与 Gemini Key 数量相同，吞吐随 Key 数扩展
+PIPELINE_ANALYZE_WORKERS = None
+# 已抓取、待分析条目的队列上限
+PIPELINE_QUEUE_SIZE = 4
+
+# === 异步模式 (main.py --async) ===
+# 单个事件循环调度所有源和条目；阻塞调用 (requests、Firecrawl、yt-dlp、smtplib) 共用的线程数上限
+ASYNC_EXECUTOR_WORKERS = 32
+
+# === 抓取内容缓存 (文章 Markdown / 视频字幕)，gzip 压缩，按 LRU 淘汰 ===
+CONTENT_CACHE_DIR = os.path.join(STATE_DIR, 'content_cache')
+CONTENT_CACHE_MAX_MB = 200
+
+# === Gemini 分析结果缓存 ===
+ANALYSIS_CACHE_PATH = os.path.join(STATE_DIR, 'analysis_cache.sqlite3')
+
+# === 批量分析：多个条目合并为一次 Gemini 请求 (Free Tier 按请求数计配额) ===
+ANALYSIS_BATCH_ENABLED = True
+# 单个批次的输入 token 预算，超过预算的长内容单独分析
+ANALYSIS_BATCH_TOKEN_BUDGET = 30000
+ANALYSIS_BATCH_MAX_ITEMS = 5
+
+# === 分析前的内容压缩 ===
+# 清洗 Markdown 噪音后，按 token 预算均匀抽取分块 (覆盖全文而不是只保留开头)
+ANALYSIS_TOKEN_BUDGET = 25000
+ANALYSIS_CHUNK_TOKENS = 1000
+
+# === 长内容 Map-Reduce 分析 ===
+# 清洗后超过该 token 数的内容 (如三小时播客字幕) 分块摘要后再汇总，而不是抽样
+MAP_REDUCE_ENABLED = True
+MAP_REDUCE_THRESHOLD_TOKENS = 40000
+MAP_REDUCE_CHUNK_TOKENS = 8000
+# 并发摘要的分块数 (仍受 Gemini 限流约束)
+MAP_REDUCE_MAX_WORKERS = 3
+
+# === YouTube 字幕对冲获取 ===
+# 主策略超过该时间仍无结果，就同时启动备用策略 (yt-dlp)
+TRANSCRIPT_HEDGE_DELAY_SECONDS = 8
+# 主策略在该时间内遇到过 429，则直接并行启动备用策略
+TRANSCRIPT_RECENT_429_SECONDS = 3600
+# 单个视频获取字幕的总时限
+TRANSCRIPT_DEADLINE_SECONDS = 120
+TRANSCRIPT_MAX_WORKERS = 4
+TRANSCRIPT_STATS_PATH = os.path.join(STATE_DIR, 'transcript_stats.json')
+
+# === 共享 HTTP 客户端 ===
+# (连接超时, 读取超时) 秒
+HTTP_TIMEOUT = (5, 15)
+# 连接错误和 429/5xx 的重试次数及退避
+HTTP_RETRIES = 2
+HTTP_BACKOFF_SECONDS = 1
+HTTP_MAX_BACKOFF_SECONDS = 30
+# 连接池：缓存的主机数、每个主机保持的连接数
+HTTP_POOL_CONNECTIONS = 32
+HTTP_POOL_MAXSIZE = 8
+
+# === Firecrawl 批量抓取 ===
+# 把 Discovery 得到的全部文章一次性并发提交给 Firecrawl，按完成顺序交给分析
+FIRECRAWL_BATCH_ENABLED = True
+FIRECRAWL_BATCH_CONCURRENCY = 4
+
+# === 断点续跑 (--resume) ===
+CHECKPOINT_DIR = os.path.join(STATE_DIR, 'checkpoint')
+# 超过该时间的未完成检查点不再续跑，重新 Discovery
+CHECKPOINT_MAX_AGE_HOURS = 20
+
+# === Gemini 多 Key / 多模型档位调度 ===
+# 多个 Key 用逗号分隔写在 GEMINI_API_KEYS 中，未设置时使用 GEMINI_API_KEY
+GEMINI_API_KEYS = [key.strip() for key in os.getenv("GEMINI_API_KEYS", "").split(",") if key.strip()] or (
+    [GEMINI_API_KEY] if GEMINI_API_KEY else []
+)
+# 模型档位，从便宜到贵排列；请求路由到第一个满足规模 / 优先级规则的档位
+# rpm / tpm / rpd 为每个 Key 在该模型上的配额 (Free Tier)
+# max_input_tokens / max_priority 为 None 表示不限制
+# 优先级 (priority.score) 上限 1.0 即默认权重源的最高分：普通条目留在 flash，
+# 加权源 (weight > 1) 或多源重复的重要条目才交给 pro
+GEMINI_MODEL_TIERS = [
+    {"model": "gemini-2.5-flash", "rpm": 10, "tpm": 250000, "rpd": 250, "burst": 2,
+     "max_input_tokens": 12000, "max_priority": 1.0},
+    {"model": "gemini-2.5-pro", "rpm": 2, "tpm": 250000, "rpd": 50, "burst": 1,
+     "max_input_tokens": None, "max_priority": None},
+]
+# 首选档位的所有 Key 都需要等待超过该时间时，改用其他档位
+GEMINI_FALLBACK_MAX_WAIT_SECONDS = 20
+# 每个 Key 当天已用的请求数 (按太平洋时间重置)
+GEMINI_QUOTA_PATH = os.path.join(STATE_DIR, 'gemini_quota.json')
+
+# === 跨源去重 (同一期节目出现在多个源：播客 RSS、Apple 解析的 Feed、YouTube 等) ===
+DEDUP_ENABLED = True
+# 标题 MinHash 相似度 (估算的 Jaccard) 达到该值，且发布时间相差不超过窗口，视为同一内容
+DEDUP_TITLE_THRESHOLD = 0.6
+DEDUP_WINDOW_HOURS = 72
+# 归一化后短于该长度的标题 (如 "Weekly Update") 不参与模糊匹配，中文字符按 2 计
+DEDUP_MIN_TITLE_CHARS = 16
+DEDUP_MINHASH_PERMUTATIONS = 64
+DEDUP_MINHASH_BANDS = 16
+# 重复条目中优先保留的类型 (YouTube 字幕是完整对话，优于节目页面的 show notes)
+DEDUP_TYPE_PRIORITY = ["youtube", "rss", "website"]
+
+# === 优先级调度与运行预算 ===
+# DATA_SOURCES 中的源可设置 "weight" (如 1.5)，未设置时使用默认权重
+DEFAULT_SOURCE_WEIGHT = 1.0
+# 优先级 = 源权重 x 类型权重 x 新鲜度 x 内容长度
+PRIORITY_TYPE_WEIGHTS = {"youtube": 1.0, "rss": 0.9, "website": 0.9}
+PRIORITY_RECENCY_HALF_LIFE_HOURS = 48
+# 正文短于该 token 数的条目 (预告、短讯) 按比例降低优先级，最低不低于 PRIORITY_MIN_LENGTH_FACTOR
+PRIORITY_FULL_LENGTH_TOKENS = 2000
+PRIORITY_MIN_LENGTH_FACTOR = 0.3
+# 同一内容每多出现在一个源，权重加分
+PRIORITY_DUPLICATE_BONUS = 0.1
+# 运行预算：到达截止时间或分析条目上限后不再开始新的抓取 / 分析，剩余的低优先级条目留到下次
+RUN_DEADLINE_MINUTES = float(os.getenv("RUN_DEADLINE_MINUTES", "300"))
+RUN_MAX_ANALYZED_ITEMS = int(os.getenv("RUN_MAX_ANALYZED_ITEMS")) if os.getenv("RUN_MAX_ANALYZED_ITEMS") else None
+
+# === 运行报告 (各阶段耗时、字节数、token、缓存命中、限流等待、失败原因) ===
+# 不放在 STATE_DIR 中：状态目录每次运行都存入 Actions 缓存，报告只需上传本次运行的文件
+RUN_REPORT_DIR = os.getenv("RUN_REPORT_DIR", os.path.join(os.path.dirname(__file__), 'reports'))
+
+# === 邮件报告 ===
+# 按分析给出的 category 分组，组的顺序 (其他类别按字母排在后面)
+REPORT_CATEGORY_ORDER = ["Hardware", "Model", "Infrastructure", "App", "Policy"]
+# 本次发送的报告 HTML 存档，随运行报告一起上传
+REPORT_ARCHIVE_DIR = RUN_REPORT_DIR
+
+# === 邮件发送 ===
+# 本地测试可指向 smtp_sink.py (SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_STARTTLS=false)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
+SMTP_TIMEOUT = 30
+# 4xx 回复、连接中断等暂时性错误的重试次数及退避
+SMTP_RETRIES = 3
+SMTP_BACKOFF_SECONDS = 5
+# 每封邮件的收件人数：1 表示每人一封 (To 为本人)，更大时一封邮件密送给一批收件人
+EMAIL_BATCH_SIZE = 1
+# 按收件人分组发送不同内容的摘要，例如：
+# {"hardware": {"recipients": ["a@example.com"], "categories": ["Hardware", "Infrastructure"]}}
+# categories 为 None 表示全部类别；为空时全部条目发送给 EMAIL_RECIPIENTS
+EMAIL_SEGMENTS = {}
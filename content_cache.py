@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# entries: (kind, identifier) -> content_hash；正文按内容哈希压缩存放在 blobs/ 下，相同正文只存一份
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (kind, identifier)
+)
+"""
+
+_conn = None
+_lock = threading.Lock()
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.join(config.CONTENT_CACHE_DIR, "blobs"), exist_ok=True)
+        _conn = sqlite3.connect(os.path.join(config.CONTENT_CACHE_DIR, "index.sqlite3"), check_same_thread=False)
+        _conn.execute(_SCHEMA)
+        _conn.commit()
+    return _conn
+
+def _blob_path(content_hash):
+    return os.path.join(config.CONTENT_CACHE_DIR, "blobs", f"{content_hash}.gz")
+
+def get(kind, identifier):
+    """
+    Return cached content for (kind, identifier), e.g. ("article", url), or None.
+    """
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute(
+            "SELECT content_hash FROM entries WHERE kind = ? AND identifier = ?",
+            (kind, identifier)
+        ).fetchone()
+        if row is None:
+            metrics.incr("cache_misses", kind)
+            return None
+
+        try:
+            with gzip.open(_blob_path(row[0]), "rt", encoding="utf-8") as f:
+                content = f.read()
+        except (OSError, EOFError) as e:
+            logger.warning(f"Content cache blob missing or corrupt for {identifier}: {e}")
+            conn.execute("DELETE FROM entries WHERE kind = ? AND identifier = ?", (kind, identifier))
+            conn.commit()
+            return None
+
+        conn.execute(
+            "UPDATE entries SET last_access = ? WHERE kind = ? AND identifier = ?",
+            (time.time(), kind, identifier)
+        )
+        conn.commit()
+
+    metrics.incr("cache_hits", kind)
+    logger.info(f"Content cache hit for {kind}: {identifier}")
+    return content
+
+def put(kind, identifier, content):
+    """
+    Store content compressed under its SHA-256 and evict least recently used entries over the size limit.
+    """
+    data = content.encode("utf-8")
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = _blob_path(content_hash)
+
+    with _lock:
+        conn = _get_conn()
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        conn.execute(
+            """
+            INSERT INTO entries (kind, identifier, content_hash, size, last_access)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(kind, identifier) DO UPDATE SET
+                content_hash = excluded.content_hash, size = excluded.size, last_access = excluded.last_access
+            """,
+            (kind, identifier, content_hash, os.path.getsize(path), time.time())
+        )
+        conn.commit()
+        _evict(conn)
+
+def _evict(conn):
+    """
+    Drop least recently used entries until the blobs fit in CONTENT_CACHE_MAX_MB.
+    """
+    max_bytes = config.CONTENT_CACHE_MAX_MB * 1024 * 1024
+    blob_sizes = dict(conn.execute("SELECT content_hash, MAX(size) FROM entries GROUP BY content_hash").fetchall())
+    total = sum(blob_sizes.values())
+    if total <= max_bytes:
+        return
+
+    rows = conn.execute("SELECT kind, identifier, content_hash FROM entries ORDER BY last_access").fetchall()
+    for kind, identifier, content_hash in rows:
+        if total <= max_bytes:
+            break
+        conn.execute("DELETE FROM entries WHERE kind = ? AND identifier = ?", (kind, identifier))
+        still_used = conn.execute(
+            "SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        if not still_used:
+            total -= blob_sizes.get(content_hash, 0)
+            try:
+                os.remove(_blob_path(content_hash))
+            except OSError:
+                pass
+    conn.commit()
+    logger.info(f"Content cache evicted entries, now {total / 1024 / 1024:.1f} MB.")
@@ -0,0 +1,243 @@
+import random
+import re
+import unicodedata
+import zlib
+import logging
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from dateutil import parser as date_parser
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 跟踪参数与 URL 是否指向同一内容无关，归一化时去掉
+_TRACKING_PARAMS = {"ref", "r", "source", "si", "feature", "fbclid", "gclid", "mc_cid", "mc_eid", "igshid"}
+_YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com"}
+
+# 标题里的期数标记在不同节目中写法不同，比较前去掉 (只用于跨源比较，同一来源的条目不做模糊匹配)
+_EPISODE_RE = re.compile(r'(#\s*\d+|\b(?:ep|episode|e)\.?\s*\d+\b|第\s*\d+\s*期)', re.IGNORECASE)
+# 上下篇是不同的内容，编号不同的不合并
+_PART_RE = re.compile(r'\b(?:part|pt)\.?\s*(\d+)\b|第\s*(\d+)\s*[部集篇]', re.IGNORECASE)
+_PUNCT_RE = re.compile(r'[^\w\s]+')
+_SPACE_RE = re.compile(r'\s+')
+
+# MinHash 的通用哈希参数 h(x) = (a * x + b) mod p，固定种子保证每次运行结果一致
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_HASH_PARAMS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(config.DEDUP_MINHASH_PERMUTATIONS)
+]
+
+def normalize_url(url):
+    """
+    Canonical form of a URL for identity checks: no scheme, www., fragment,
+    tracking parameters or trailing slash; YouTube links become youtube:<id>.
+    """
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = parse_qsl(parts.query, keep_blank_values=True)
+
+    if host in _YOUTUBE_HOSTS and parts.path == "/watch":
+        video_id = dict(query).get("v")
+        if video_id:
+            return f"youtube:{video_id}"
+    if host == "youtu.be" and len(parts.path) > 1:
+        return f"youtube:{parts.path.strip('/')}"
+
+    query = sorted(
+        (key, value) for key, value in query
+        if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("", host, path, urlencode(query), ""))
+
+def normalize_title(title):
+    title = unicodedata.normalize("NFKC", title or "").lower()
+    title = _EPISODE_RE.sub(" ", title)
+    title = _PUNCT_RE.sub(" ", title)
+    return _SPACE_RE.sub(" ", title).strip()
+
+def title_weight(title):
+    # 中日韩字符信息量更大，按 2 个字符计
+    return sum(2 if ord(char) >= 0x2E80 else 1 for char in title)
+
+def shingles(text, size=4):
+    """
+    Character n-grams of a normalized title (works for both English and Chinese titles).
+    """
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def minhash(shingle_set):
+    """
+    MinHash signature of a shingle set, one value per configured permutation.
+    """
+    hashed = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+    return tuple(min((a * value + b) % _PRIME for value in hashed) for a, b in _HASH_PARAMS)
+
+def similarity(signature_a, signature_b):
+    """
+    Estimated Jaccard similarity of two MinHash signatures.
+    """
+    same = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return same / len(signature_a)
+
+def identity_keys(item):
+    """
+    Exact identity keys of an item: normalized URL, enclosure URL and GUID.
+    """
+    keys = set()
+    for field in ("url", "enclosure"):
+        normalized = normalize_url(item.get(field))
+        if normalized:
+            keys.add(f"url:{normalized}")
+    if item.get("video_id"):
+        keys.add(f"url:youtube:{item['video_id']}")
+    guid = item.get("guid")
+    # 纯数字等短 GUID 只在单个 Feed 内唯一，不能跨源比较
+    if guid and (len(guid) >= 16 or "://" in guid):
+        keys.add(f"guid:{guid.strip()}")
+    return keys
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, index):
+        while self.parent[index] != index:
+            self.parent[index] = self.parent[self.parent[index]]
+            index = self.parent[index]
+        return index
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # 保留较小的下标作为根，结果与输入顺序一致
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+def _published(item):
+    try:
+        return date_parser.isoparse(item["published_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _parts(item):
+    return {number for match in _PART_RE.findall(item.get("title") or "") for number in match if number}
+
+def _fuzzy_match_allowed(item_a, item_b):
+    # 模糊匹配只用于跨源去重：同一来源的不同条目 (如同一节目的不同期) 不合并
+    if item_a.get("source_name") == item_b.get("source_name"):
+        return False
+    parts_a, parts_b = _parts(item_a), _parts(item_b)
+    if parts_a and parts_b and parts_a != parts_b:
+        return False
+    return _within_window(item_a, item_b)
+
+def _within_window(item_a, item_b):
+    published_a, published_b = _published(item_a), _published(item_b)
+    if published_a is None or published_b is None:
+        return True
+    return abs(published_a - published_b) <= timedelta(hours=config.DEDUP_WINDOW_HOURS)
+
+def cluster(items):
+    """
+    Group indexes of items that refer to the same content. Items are linked by a shared
+    identity key, or by similar titles (MinHash + LSH banding) from different sources,
+    published within DEDUP_WINDOW_HOURS. A title match never joins two groups that
+    already contain the same source.
+    """
+    groups = _UnionFind(len(items))
+
+    owners = {}
+    for index, item in enumerate(items):
+        for key in identity_keys(item):
+            if key in owners:
+                groups.union(owners[key], index)
+            else:
+                owners[key] = index
+
+    signatures = {}
+    for index, item in enumerate(items):
+        title = normalize_title(item.get("title"))
+        if title_weight(title) >= config.DEDUP_MIN_TITLE_CHARS:
+            signatures[index] = minhash(shingles(title))
+
+    # LSH：签名分段，任一段完全相同的条目才作为候选对，避免两两比较
+    rows = config.DEDUP_MINHASH_PERMUTATIONS // config.DEDUP_MINHASH_BANDS
+    candidates = set()
+    for band in range(config.DEDUP_MINHASH_BANDS):
+        buckets = {}
+        for index, signature in signatures.items():
+            buckets.setdefault(signature[band * rows:(band + 1) * rows], []).append(index)
+        for bucket in buckets.values():
+            for position, a in enumerate(bucket):
+                for b in bucket[position + 1:]:
+                    candidates.add((a, b))
+
+    # 每个组包含的来源，防止通过传递关系把同一来源的两个条目合并
+    sources = {}
+    for index, item in enumerate(items):
+        sources.setdefault(groups.find(index), set()).add(item.get("source_name"))
+
+    # 先合并最相似的候选对，同一来源的多个近似条目中只有最接近的那个会被合并
+    scored = sorted(
+        ((similarity(signatures[a], signatures[b]), a, b) for a, b in candidates),
+        key=lambda candidate: (-candidate[0], candidate[1], candidate[2])
+    )
+    for score, a, b in scored:
+        if score < config.DEDUP_TITLE_THRESHOLD or not _fuzzy_match_allowed(items[a], items[b]):
+            continue
+        root_a, root_b = groups.find(a), groups.find(b)
+        if root_a == root_b or sources[root_a] & sources[root_b]:
+            continue
+        groups.union(a, b)
+        root = groups.find(a)
+        sources[root] = sources.pop(root_a) | sources.pop(root_b)
+
+    clusters = {}
+    for index in range(len(items)):
+        clusters.setdefault(groups.find(index), []).append(index)
+    return list(clusters.values())
+
+def _preference(indexed):
+    index, item = indexed
+    priority = config.DEDUP_TYPE_PRIORITY
+    source_type = item.get("source_type")
+    rank = priority.index(source_type) if source_type in priority else len(priority)
+    return (rank, index)
+
+def dedupe_items(items):
+    """
+    Collapse items that refer to the same content so each is ingested and analyzed once.
+    The kept item (by DEDUP_TYPE_PRIORITY, then discovery order) carries the others in
+    item['duplicates'] so the report can list every source.
+    """
+    if not config.DEDUP_ENABLED or len(items) < 2:
+        return items
+
+    kept = []
+    for members in cluster(items):
+        indexed = sorted(((index, items[index]) for index in members), key=_preference)
+        index, item = indexed[0]
+        if len(indexed) > 1:
+            item = dict(item)
+            item["duplicates"] = [duplicate for _, duplicate in indexed[1:]]
+            logger.info(
+                f"Duplicate content: keeping [{item['source_name']}] {item['title']}, also in "
+                + ", ".join(f"[{duplicate['source_name']}] {duplicate['title']}" for duplicate in item["duplicates"])
+            )
+        kept.append((index, item))
+
+    kept.sort(key=lambda entry: entry[0])
+    collapsed = len(items) - len(kept)
+    if collapsed:
+        metrics.incr("duplicates", "collapsed", collapsed)
+        logger.info(f"Dedup: collapsed {collapsed} duplicate items, {len(kept)} remaining.")
+    return [item for _, item in kept]
@@ -1,3 +1,4 @@
+import asyncio
 import feedparser
 import datetime
 from datetime import timezone, timedelta
@@ -5,14 +6,56 @@ from dateutil import parser as date_parser
 import logging
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import requests
 import config
+import http_client
+import metrics
+import seen_store
+import feed_cache
+import apple_feed_cache
 import io
+from xml.etree import ElementTree
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager, asynccontextmanager
+from urllib.parse import urlparse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 每个主机一个信号量，限制对同一主机的并发请求数
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+@contextmanager
+def host_slot(url):
+    """
+    Limit concurrent requests to the same host to DISCOVERY_PER_HOST_LIMIT.
+    """
+    host = urlparse(url).netloc.lower()
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(config.DISCOVERY_PER_HOST_LIMIT)
+            _host_semaphores[host] = semaphore
+    with semaphore:
+        yield
+
+# asyncio 模式下的主机信号量，绑定当前事件循环
+_async_host_semaphores = {}
+
+@asynccontextmanager
+async def host_slot_async(url):
+    """
+    host_slot() for the asyncio mode.
+    """
+    host = urlparse(url).netloc.lower()
+    semaphore = _async_host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = _async_host_semaphores[host] = asyncio.Semaphore(config.DISCOVERY_PER_HOST_LIMIT)
+    async with semaphore:
+        yield
+
 def is_recent(published_date):
     """
     Check if the content was published within the configured lookback period.
@@ -28,41 +71,251 @@ def is_recent(published_date):
     cutoff = now - timedelta(hours=config.LOOKBACK_HOURS)
     return published_date >= cutoff
 
+def lookup_apple_ids(apple_ids):
+    """
+    Resolve several Apple Podcast IDs to RSS Feed URLs with a single iTunes API request.
+    """
+    apple_ids = [str(apple_id) for apple_id in apple_ids]
+    if not apple_ids:
+        return {}
+
+    try:
+        # iTunes API 查找接口，支持逗号分隔的多个 id
+        api_url = f"https://itunes.apple.com/lookup?id={','.join(apple_ids)}&entity=podcast"
+        with host_slot(api_url):
+            response = http_client.get(api_url)
+        metrics.incr("bytes_fetched", "itunes", len(response.content))
+        data = response.json()
+
+        resolved = {}
+        for result in data.get("results", []):
+            apple_id = str(result.get("collectionId", ""))
+            feed_url = result.get("feedUrl")
+            if apple_id in apple_ids and feed_url:
+                resolved[apple_id] = feed_url
+
+        for apple_id in apple_ids:
+            if apple_id in resolved:
+                logger.info(f"Resolved Apple ID {apple_id} to RSS: {resolved[apple_id]}")
+            else:
+                logger.warning(f"No feedUrl found for Apple ID {apple_id}")
+
+        apple_feed_cache.store(resolved)
+        return resolved
+
+    except Exception as e:
+        logger.error(f"Failed to resolve Apple IDs {', '.join(apple_ids)}: {e}")
+        return {}
+
+def resolve_apple_ids(apple_ids):
+    """
+    Resolve Apple Podcast IDs through the local cache.
+    Missing IDs are looked up in one batch; stale ones are returned immediately
+    and refreshed in the background.
+    """
+    fresh, stale, missing = apple_feed_cache.lookup([str(apple_id) for apple_id in apple_ids])
+    metrics.incr("cache_hits", "apple_feed", len(fresh) + len(stale))
+    metrics.incr("cache_misses", "apple_feed", len(missing))
+
+    resolved = dict(fresh)
+    resolved.update(stale)
+    if missing:
+        resolved.update(lookup_apple_ids(missing))
+    if stale:
+        threading.Thread(target=lookup_apple_ids, args=(list(stale),), name="apple-revalidate").start()
+
+    return resolved
+
 def get_feed_from_apple_id(apple_id):
     """
     Resolve Apple Podcast ID to an RSS Feed URL using iTunes API.
     """
+    return resolve_apple_ids([apple_id]).get(str(apple_id))
+
+def build_post(source, title, link, guid, published_dt, enclosure=None):
+    """
+    Build a discovery item for a recent feed entry.
+    """
+    logger.info(f"Found recent article: {title}")
+    return {
+        "title": title,
+        "url": link,
+        "guid": guid,
+        "enclosure": enclosure,
+        "published_at": published_dt.isoformat(),
+        "source_name": source['name'],
+        "source_type": "rss",
+        "category": source.get('category', "General")
+    }
+
+def parse_date(value):
+    """
+    Leniently parse a feed date string into an aware datetime, or None.
+    """
+    if not value:
+        return None
     try:
-        # iTunes API 查找接口
-        api_url = f"https://itunes.apple.com/lookup?id={apple_id}&entity=podcast"
-        response = requests.get(api_url, timeout=10)
-        data = response.json()
-        
-        if data.get("resultCount", 0) > 0:
-            feed_url = data["results"][0].get("feedUrl")
-            if feed_url:
-                logger.info(f"Resolved Apple ID {apple_id} to RSS: {feed_url}")
-                return feed_url
-            
-        logger.warning(f"No feedUrl found for Apple ID {apple_id}")
+        published_dt = date_parser.parse(value)
+        if published_dt.tzinfo is None:
+            published_dt = published_dt.replace(tzinfo=timezone.utc)
+        return published_dt
+    except Exception:
         return None
+
+def parse_feed(content, source, url):
+    """
+    Parse a complete feed body with feedparser and return recent posts.
+    """
+    # 将获取到的内容传给 feedparser
+    content_stream = io.BytesIO(content)
+    feed = feedparser.parse(content_stream)
+    
+    if feed.bozo:
+        logger.warning(f"Potential issue parsing feed {url}: {feed.bozo_exception}")
         
-    except Exception as e:
-        logger.error(f"Failed to resolve Apple ID {apple_id}: {e}")
-        return None
+    recent_posts = []
+    
+    for entry in feed.entries:
+        published_dt = None
+        if hasattr(entry, 'published_parsed') and entry.published_parsed:
+            published_dt = datetime.datetime(*entry.published_parsed[:6], tzinfo=timezone.utc)
+        elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
+            published_dt = datetime.datetime(*entry.updated_parsed[:6], tzinfo=timezone.utc)
+        
+        # 容错：尝试直接解析字符串时间
+        if not published_dt and hasattr(entry, 'updated'):
+            published_dt = parse_date(entry.updated)
+        
+        # 容错：有些 RSS 用 pubDate
+        if not published_dt and hasattr(entry, 'published'):
+            published_dt = parse_date(entry.published)
 
-def get_rss_posts(source, override_url=None):
+        if published_dt and is_recent(published_dt):
+            enclosures = entry.get('enclosures') or [{}]
+            recent_posts.append(build_post(
+                source, entry.title, entry.link, entry.get('id'), published_dt, enclosures[0].get('href')
+            ))
+    
+    return recent_posts
+
+class _RecordingReader:
     """
-    Fetch recent posts from an RSS feed with User-Agent spoofing.
+    File-like wrapper that keeps a copy of everything read, so a failed
+    streaming parse can fall back to feedparser without downloading again.
     """
+    def __init__(self, raw):
+        self.raw = raw
+        self.chunks = []
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.chunks.append(data)
+        metrics.incr("bytes_fetched", "rss", len(data))
+        return data
+
+    def remaining(self):
+        return b"".join(self.chunks) + self.raw.read()
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _entry_fields(element):
+    """
+    Extract title, link, guid, date and enclosure URL from an RSS <item> or Atom <entry> element.
+    """
+    fields = {}
+    for child in element:
+        name = _local_name(child.tag)
+        if name == 'link':
+            # Atom 用 href 属性，RSS 用文本
+            href = child.get('href')
+            if href and child.get('rel', 'alternate') == 'alternate':
+                fields.setdefault('link', href)
+            elif child.text:
+                fields.setdefault('link', child.text.strip())
+            # Atom 的附件是 rel="enclosure" 的 link
+            if href and child.get('rel') == 'enclosure':
+                fields.setdefault('enclosure', href)
+        elif name == 'enclosure' and child.get('url'):
+            fields.setdefault('enclosure', child.get('url'))
+        elif name in ('title', 'guid', 'id', 'pubDate', 'published', 'updated', 'date') and child.text:
+            fields.setdefault(name, child.text.strip())
+
+    published_dt = None
+    for key in ('pubDate', 'published', 'date', 'updated'):
+        published_dt = parse_date(fields.get(key))
+        if published_dt:
+            break
+
+    return (fields.get('title', ''), fields.get('link'), fields.get('guid') or fields.get('id'),
+            published_dt, fields.get('enclosure'))
+
+def parse_feed_stream(response, source, url):
+    """
+    Incrementally parse a streamed feed response and return recent posts.
+    Stops reading once FEED_STREAM_STOP_AFTER_OLD consecutive entries fall
+    outside the lookback window while entries are newest first; once an entry is newer
+    than the one before it the feed is read to the end.
+    """
+    response.raw.decode_content = True
+    reader = _RecordingReader(response.raw)
+
+    recent_posts = []
+    old_streak = 0
+    # 只有条目按时间倒序排列时才能提前结束；升序或乱序的 Feed 读完整个文件
+    newest_first = True
+    previous_dt = None
+    try:
+        for _, element in ElementTree.iterparse(reader, events=('end',)):
+            if _local_name(element.tag) not in ('item', 'entry'):
+                continue
+
+            title, link, guid, published_dt, enclosure = _entry_fields(element)
+            # 释放已处理条目的内存
+            element.clear()
+
+            if published_dt is None:
+                # 缺少日期的条目既不算旧条目，也不影响顺序判断
+                continue
+            if previous_dt is not None and published_dt > previous_dt:
+                newest_first = False
+            previous_dt = published_dt
+
+            if is_recent(published_dt):
+                old_streak = 0
+                if link:
+                    recent_posts.append(build_post(source, title, link, guid, published_dt, enclosure))
+            elif newest_first:
+                old_streak += 1
+                if old_streak >= config.FEED_STREAM_STOP_AFTER_OLD:
+                    logger.info(f"Stopped reading {url} after {old_streak} entries outside the lookback window.")
+                    break
+
+    except ElementTree.ParseError as e:
+        # 非严格 XML (如 HTML 实体)，退回 feedparser 处理完整内容
+        logger.warning(f"Streaming parse failed for {url} ({e}), falling back to feedparser.")
+        return parse_feed(reader.remaining(), source, url)
+
+    finally:
+        response.close()
+
+    return recent_posts
+
+def rss_url(source, override_url=None):
     url = override_url if override_url else source.get('url')
     
     if not url:
         logger.error(f"No URL provided for source {source['name']}")
-        return []
+        return None
 
     logger.info(f"Checking RSS feed: {url}")
-    
+    return url
+
+def fetch_rss_posts(source, url):
+    """
+    Fetch and parse one feed. The caller holds the host slot: a streamed body keeps
+    the connection busy until parsing is done.
+    """
     try:
         # === 增强 Header ===
         headers = {
@@ -70,66 +323,69 @@ def get_rss_posts(source, override_url=None):
             'Accept': 'application/rss+xml, application/xml, application/atom+xml, text/xml;q=0.9, */*;q=0.8',
             'Referer': 'https://www.google.com/' # 增加 Referer 看起来更像正常流量
         }
+        # 条件请求：Feed 未变化时服务器返回 304，无需下载和解析
+        headers.update(feed_cache.conditional_headers(url))
+        
+        response = http_client.get(url, headers=headers, stream=config.FEED_STREAMING)
         
-        response = requests.get(url, headers=headers, timeout=15)
+        if response.status_code == 304:
+            response.close()
+            cached_posts = feed_cache.get_posts(url)
+            if cached_posts is not None:
+                metrics.incr("cache_hits", "feed")
+                logger.info(f"Feed not modified, using cached result: {url}")
+                return [
+                    post for post in cached_posts
+                    if is_recent(date_parser.isoparse(post['published_at']))
+                ]
+            # 缓存丢失，去掉条件头重新完整请求
+            for key in ('If-None-Match', 'If-Modified-Since'):
+                headers.pop(key, None)
+            response = http_client.get(url, headers=headers, stream=config.FEED_STREAMING)
         
         # 如果是 403，记录更详细的信息，但不崩溃
         if response.status_code == 403:
+            response.close()
             logger.error(f"403 Forbidden accessing {url}. Source might require browser verification.")
+            metrics.incr("failures", "rss_403")
             return []
         
         response.raise_for_status()
         
-        # 将获取到的内容传给 feedparser
-        content_stream = io.BytesIO(response.content)
-        feed = feedparser.parse(content_stream)
-        
-        if feed.bozo:
-            logger.warning(f"Potential issue parsing feed {url}: {feed.bozo_exception}")
-            
-        recent_posts = []
-        
-        for entry in feed.entries:
-            published_dt = None
-            if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                published_dt = datetime.datetime(*entry.published_parsed[:6], tzinfo=timezone.utc)
-            elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
-                published_dt = datetime.datetime(*entry.updated_parsed[:6], tzinfo=timezone.utc)
-            
-            # 容错：尝试直接解析字符串时间
-            if not published_dt and hasattr(entry, 'updated'):
-                 try:
-                     published_dt = date_parser.parse(entry.updated)
-                     if published_dt.tzinfo is None:
-                         published_dt = published_dt.replace(tzinfo=timezone.utc)
-                 except:
-                     pass
-            
-            # 容错：有些 RSS 用 pubDate
-            if not published_dt and hasattr(entry, 'published'):
-                 try:
-                     published_dt = date_parser.parse(entry.published)
-                     if published_dt.tzinfo is None:
-                         published_dt = published_dt.replace(tzinfo=timezone.utc)
-                 except:
-                     pass
-
-            if published_dt and is_recent(published_dt):
-                logger.info(f"Found recent article: {entry.title}")
-                recent_posts.append({
-                    "title": entry.title,
-                    "url": entry.link,
-                    "published_at": published_dt.isoformat(),
-                    "source_name": source['name'],
-                    "source_type": "rss",
-                    "category": source.get('category', "General")
-                })
+        if config.FEED_STREAMING:
+            recent_posts = parse_feed_stream(response, source, url)
+        else:
+            metrics.incr("bytes_fetched", "rss", len(response.content))
+            recent_posts = parse_feed(response.content, source, url)
         
+        feed_cache.store(url, response, recent_posts)
         return recent_posts
         
     except Exception as e:
         logger.error(f"Error fetching RSS {url}: {e}")
+        metrics.incr("failures", "rss_fetch")
+        return []
+
+def get_rss_posts(source, override_url=None):
+    """
+    Fetch recent posts from an RSS feed with User-Agent spoofing.
+    """
+    url = rss_url(source, override_url)
+    if not url:
+        return []
+    with host_slot(url):
+        return fetch_rss_posts(source, url)
+
+async def get_rss_posts_async(source, override_url=None):
+    """
+    get_rss_posts() for the asyncio mode: the host slot is awaited on the loop, the
+    request and the (streamed) parse run on the loop's executor.
+    """
+    url = rss_url(source, override_url)
+    if not url:
         return []
+    async with host_slot_async(url):
+        return await asyncio.to_thread(fetch_rss_posts, source, url)
 
 def get_youtube_videos(source):
     # 保持不变
@@ -158,7 +414,8 @@ def get_youtube_videos(source):
             type="video",
             maxResults=10
         )
-        response = request.execute()
+        with host_slot("https://www.googleapis.com"):
+            response = request.execute()
         
         recent_videos = []
         for item in response.get('items', []):
@@ -186,38 +443,148 @@ def get_youtube_videos(source):
         logger.error(f"Error fetching YouTube {source['name']}: {e}")
         return []
 
-def discover_content():
+@contextmanager
+def _source_span(category, source):
     """
-    Main discovery function to aggregate content from all sources.
+    Metrics span around discovering one source; yields (record, posts) for the caller
+    to fill. Unexpected errors are logged and fail the span instead of the run.
+    """
+    posts = []
+    with metrics.span("discovery", source['name']) as record:
+        try:
+            source['category'] = category
+            yield record, posts
+        except Exception as e:
+            logger.error(f"Unexpected error processing source {source['name']}: {e}")
+            record["ok"] = False
+            record["error"] = "unexpected"
+
+        record["items"] = len(posts)
+
+def source_target(source, apple_feeds, record):
+    """
+    What to fetch for a source: ("rss", feed URL override or None) or ("youtube", None).
+    Returns None when there is nothing to fetch; an unresolved Apple ID fails record.
+    """
+    if source['type'] == 'rss':
+        return "rss", None
+
+    elif source['type'] == 'youtube':
+        return "youtube", None
+
+    elif source['type'] == 'apple_podcast':
+        if apple_feeds is not None:
+            rss_url = apple_feeds.get(str(source['apple_id']))
+        else:
+            rss_url = get_feed_from_apple_id(source['apple_id'])
+        if rss_url:
+            return "rss", rss_url
+        record["ok"] = False
+        record["error"] = "apple_id_unresolved"
+
+    return None
+
+def discover_source(category, source, apple_feeds=None):
+    """
+    Fetch recent items from a single configured source.
+    apple_feeds optionally holds pre-resolved Apple ID -> RSS Feed URL mappings.
+    """
+    with _source_span(category, source) as (record, posts):
+        kind, rss_url = source_target(source, apple_feeds, record) or (None, None)
+        if kind == "rss":
+            posts.extend(get_rss_posts(source, override_url=rss_url))
+        elif kind == "youtube":
+            posts.extend(get_youtube_videos(source))
+    return posts
+
+async def get_youtube_videos_async(source):
+    """
+    get_youtube_videos() for the asyncio mode; the Google API client is blocking and runs on the executor.
+    """
+    async with host_slot_async("https://www.googleapis.com"):
+        return await asyncio.to_thread(get_youtube_videos, source)
+
+async def discover_source_async(category, source, apple_feeds):
+    """
+    discover_source() for the asyncio mode.
+    """
+    with _source_span(category, source) as (record, posts):
+        kind, rss_url = source_target(source, apple_feeds, record) or (None, None)
+        if kind == "rss":
+            posts.extend(await get_rss_posts_async(source, override_url=rss_url))
+        elif kind == "youtube":
+            posts.extend(await get_youtube_videos_async(source))
+    return posts
+
+def _discovery_jobs():
+    return [
+        (category, source)
+        for category, sources in config.DATA_SOURCES.items()
+        for source in sources
+    ]
+
+def _apple_ids(jobs):
+    # 所有 Apple 源合并为一次 iTunes 查询
+    return [source['apple_id'] for _, source in jobs if source['type'] == 'apple_podcast']
+
+def _collect(jobs, futures, done):
+    """
+    Concatenate the posts of the sources that finished within the budget, in DATA_SOURCES order.
     """
     all_content = []
-    
-    for category, sources in config.DATA_SOURCES.items():
-        for source in sources:
-            try:
-                source['category'] = category 
-
-                if source['type'] == 'rss':
-                    posts = get_rss_posts(source)
-                    all_content.extend(posts)
-                    
-                elif source['type'] == 'youtube':
-                    videos = get_youtube_videos(source)
-                    all_content.extend(videos)
-                
-                elif source['type'] == 'apple_podcast':
-                    rss_url = get_feed_from_apple_id(source['apple_id'])
-                    if rss_url:
-                        posts = get_rss_posts(source, override_url=rss_url)
-                        all_content.extend(posts)
-
-            except Exception as e:
-                logger.error(f"Unexpected error processing source {source['name']}: {e}")
-                continue
-                
+    for (category, source), future in zip(jobs, futures):
+        if future in done:
+            all_content.extend(future.result())
+        else:
+            logger.warning(f"Discovery budget exceeded, skipping source {source['name']}")
+    return all_content
+
+def _finish_discovery(all_content):
+    # 过滤掉之前已经处理过的条目
+    all_content = seen_store.filter_new(all_content)
+
     logger.info(f"Discovery complete. Found {len(all_content)} items.")
     return all_content
 
+def discover_content():
+    """
+    Main discovery function to aggregate content from all sources.
+    Sources are fetched concurrently within DISCOVERY_BUDGET_SECONDS;
+    results keep the DATA_SOURCES order.
+    """
+    jobs = _discovery_jobs()
+    apple_feeds = resolve_apple_ids(_apple_ids(jobs))
+
+    executor = ThreadPoolExecutor(max_workers=config.DISCOVERY_MAX_WORKERS)
+    try:
+        futures = [
+            executor.submit(discover_source, category, source, apple_feeds)
+            for category, source in jobs
+        ]
+        done, not_done = wait(futures, timeout=config.DISCOVERY_BUDGET_SECONDS)
+        all_content = _collect(jobs, futures, done)
+    finally:
+        # 不等待超时的源，直接放弃
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return _finish_discovery(all_content)
+
+async def discover_content_async():
+    """
+    discover_content() for the asyncio mode: every source is a task on one event loop,
+    limited per host by DISCOVERY_PER_HOST_LIMIT and overall by DISCOVERY_BUDGET_SECONDS.
+    """
+    jobs = _discovery_jobs()
+    # iTunes 查询和 Apple 缓存文件都是阻塞的，整体放到线程池
+    apple_feeds = await asyncio.to_thread(resolve_apple_ids, _apple_ids(jobs))
+
+    tasks = [asyncio.create_task(discover_source_async(category, source, apple_feeds)) for category, source in jobs]
+    done, not_done = await asyncio.wait(tasks, timeout=config.DISCOVERY_BUDGET_SECONDS)
+    for task in not_done:
+        task.cancel()
+
+    return await asyncio.to_thread(_finish_discovery, _collect(jobs, tasks, done))
+
 if __name__ == "__main__":
     results = discover_content()
     for item in results:
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_lock = threading.Lock()
+
+def _load():
+    global _cache
+    if _cache is None:
+        try:
+            with open(config.FEED_CACHE_PATH, "r", encoding="utf-8") as f:
+                _cache = json.load(f)
+        except FileNotFoundError:
+            _cache = {}
+        except Exception as e:
+            logger.warning(f"Feed cache unreadable, starting empty: {e}")
+            _cache = {}
+    return _cache
+
+def _save():
+    os.makedirs(os.path.dirname(config.FEED_CACHE_PATH), exist_ok=True)
+    tmp_path = config.FEED_CACHE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_cache, f, ensure_ascii=False)
+    os.replace(tmp_path, config.FEED_CACHE_PATH)
+
+def conditional_headers(url):
+    """
+    Build If-None-Match / If-Modified-Since headers from the cached validators for url.
+    """
+    with _lock:
+        entry = _load().get(url)
+    if not entry:
+        return {}
+
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def get_posts(url):
+    """
+    Return the posts parsed on the last successful fetch of url, or None.
+    """
+    with _lock:
+        entry = _load().get(url)
+    return entry["posts"] if entry else None
+
+def store(url, response, posts):
+    """
+    Remember the response validators and the parsed posts for url.
+    """
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    with _lock:
+        cache = _load()
+        if not etag and not last_modified:
+            # 服务器不支持条件请求，缓存没有意义
+            if cache.pop(url, None) is None:
+                return
+        else:
+            cache[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "posts": posts,
+                "fetched_at": time.time()
+            }
+        _save()
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import logging
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import google.generativeai as genai
+import google.ai.generativelanguage as glm
+import config
+import rate_limiter
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Free Tier 的每日配额在太平洋时间午夜重置
+_QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+class QuotaExhausted(Exception):
+    """
+    Every configured key has used up its daily quota on every model tier.
+    """
+
+def make_model(api_key, model_name):
+    """
+    Create a GenerativeModel bound to one API key.
+    """
+    model = genai.GenerativeModel(model_name)
+    # SDK 只支持全局 configure(api_key)，这里为每个 Key 注入独立的客户端
+    # (私有属性，依赖 requirements.txt 中固定的 google-generativeai 版本)
+    model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    return model
+
+def make_async_model(api_key, model_name):
+    """
+    Create a GenerativeModel bound to one API key for generate_content_async.
+    The async client is tied to the running event loop, so this is called from inside it.
+    """
+    model = genai.GenerativeModel(model_name)
+    model._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+    return model
+
+class ModelSlot:
+    """
+    One API key on one model tier: its own client, per-minute limiter and daily request budget.
+    """
+    def __init__(self, key_index, api_key, tier):
+        self.model_name = tier["model"]
+        self.name = f"{tier['model']}#key{key_index}"
+        # 配额文件里只保存 Key 的摘要
+        self.quota_id = f"{tier['model']}:{hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:12]}"
+        self.rpd = tier.get("rpd")
+        self.limiter = rate_limiter.RateLimiter(self.name, tier["rpm"], tier.get("tpm"), tier.get("burst"))
+        self._api_key = api_key
+        self._model = None
+        self._async_model = None
+        self._model_lock = threading.Lock()
+
+    def get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = make_model(self._api_key, self.model_name)
+            return self._model
+
+    def get_async_model(self):
+        with self._model_lock:
+            if self._async_model is None:
+                self._async_model = make_async_model(self._api_key, self.model_name)
+            return self._async_model
+
+class Scheduler:
+    """
+    Routes Gemini requests across every configured key and model tier.
+    A request goes to the cheapest tier whose size / priority rule it meets; within
+    the tier the key that can send soonest (with daily quota left) is used. If every
+    key of that tier would wait longer than GEMINI_FALLBACK_MAX_WAIT_SECONDS or is out
+    of daily quota, the next tier up (then down) is tried.
+    """
+    def __init__(self, api_keys, tiers):
+        self.tiers = tiers
+        self.slots = {
+            tier["model"]: [ModelSlot(index, key, tier) for index, key in enumerate(api_keys)]
+            for tier in tiers
+        }
+        self._lock = threading.Lock()
+        self._usage = self._load_usage()
+
+    def _today(self):
+        return datetime.now(_QUOTA_TIMEZONE).date().isoformat()
+
+    def _load_usage(self):
+        try:
+            with open(config.GEMINI_QUOTA_PATH, "r", encoding="utf-8") as f:
+                usage = json.load(f)
+            if usage.get("date") == self._today():
+                return usage
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Gemini quota file unreadable, starting empty: {e}")
+        return {"date": self._today(), "used": {}}
+
+    def _save_usage(self):
+        os.makedirs(os.path.dirname(config.GEMINI_QUOTA_PATH), exist_ok=True)
+        tmp_path = config.GEMINI_QUOTA_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._usage, f)
+        os.replace(tmp_path, config.GEMINI_QUOTA_PATH)
+
+    def _remaining_today(self, slot):
+        if self._usage["date"] != self._today():
+            self._usage = {"date": self._today(), "used": {}}
+        if slot.rpd is None:
+            return float("inf")
+        return slot.rpd - self._usage["used"].get(slot.quota_id, 0)
+
+    def tier_order(self, size_tokens, priority=None):
+        """
+        Tiers to try for a request: the cheapest one meeting the rule, then more capable ones, then cheaper ones.
+        """
+        chosen = len(self.tiers) - 1
+        for index, tier in enumerate(self.tiers):
+            max_tokens = tier.get("max_input_tokens")
+            max_priority = tier.get("max_priority")
+            if ((max_tokens is None or size_tokens <= max_tokens)
+                    and (max_priority is None or priority is None or priority <= max_priority)):
+                chosen = index
+                break
+        return self.tiers[chosen:] + self.tiers[:chosen][::-1]
+
+    def preferred_model(self, size_tokens, priority=None):
+        return self.tier_order(size_tokens, priority)[0]["model"]
+
+    def _pick(self, size_tokens, tokens, priority):
+        """
+        Choose the slot for one request and reserve its daily quota (no waiting).
+        """
+        order = self.tier_order(size_tokens, priority)
+        with self._lock:
+            slot, fallback = None, None
+            for tier in order:
+                # 等待时间相同时选当天用得最少的 Key，请求均匀分散
+                candidates = [
+                    (candidate.limiter.wait_time(tokens), self._usage["used"].get(candidate.quota_id, 0), candidate)
+                    for candidate in self.slots[tier["model"]]
+                    if self._remaining_today(candidate) > 0
+                ]
+                if not candidates:
+                    continue
+                wait, _, best = min(candidates, key=lambda candidate: candidate[:2])
+                if wait <= config.GEMINI_FALLBACK_MAX_WAIT_SECONDS:
+                    slot = best
+                    break
+                if fallback is None or wait < fallback[0]:
+                    fallback = (wait, best)
+
+            if slot is None:
+                if fallback is None:
+                    raise QuotaExhausted("Daily Gemini quota exhausted on every key and tier.")
+                slot = fallback[1]
+
+            used = self._usage["used"]
+            used[slot.quota_id] = used.get(slot.quota_id, 0) + 1
+            self._save_usage()
+
+        if slot.model_name != order[0]["model"]:
+            logger.info(f"Gemini scheduler: falling back to {slot.model_name}.")
+            metrics.incr("llm_fallbacks", slot.model_name)
+        return slot
+
+    def acquire(self, size_tokens, tokens, priority=None):
+        """
+        Pick a slot for one request, reserve its daily quota and wait for its per-minute limiter.
+        """
+        slot = self._pick(size_tokens, tokens, priority)
+        slot.limiter.acquire(tokens=tokens)
+        return slot
+
+    async def acquire_async(self, size_tokens, tokens, priority=None):
+        """
+        acquire() for the asyncio mode: the quota file write and the per-minute wait do not block the event loop.
+        """
+        slot = await asyncio.to_thread(self._pick, size_tokens, tokens, priority)
+        await slot.limiter.acquire_async(tokens=tokens)
+        return slot
+
+    def throttled(self, slot, exc):
+        """
+        Handle a 429 on slot: a per-day quota error retires the slot until tomorrow,
+        anything else pauses it for the suggested delay.
+        """
+        if "PerDay" in str(exc):
+            logger.warning(f"Gemini scheduler: daily quota exhausted for {slot.name}.")
+            with self._lock:
+                if slot.rpd is not None:
+                    self._usage["used"][slot.quota_id] = slot.rpd
+                else:
+                    slot.rpd = 0
+                self._save_usage()
+            return
+        slot.limiter.penalize(rate_limiter.retry_after_seconds(exc))
+
+    def should_retry(self, slot, attempt, exc):
+        """
+        Decide whether a failed request is retried: rate-limit errors are, while attempts
+        remain, after throttling slot so the next attempt goes to another key or tier.
+        """
+        if attempt >= self.max_attempts() - 1 or not rate_limiter.is_rate_limited(exc):
+            return False
+        self.throttled(slot, exc)
+        return True
+
+    def has_quota(self):
+        """
+        Whether any key still has daily quota on any tier (True when no keys are configured,
+        so the analyzer reports the missing key itself).
+        """
+        with self._lock:
+            slots = [slot for tier_slots in self.slots.values() for slot in tier_slots]
+            return not slots or any(self._remaining_today(slot) > 0 for slot in slots)
+
+    def max_attempts(self):
+        # 每次重试都可能换到另一个 Key / 档位
+        return config.RATE_LIMIT_MAX_RETRIES + sum(len(slots) for slots in self.slots.values())
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """
+    Return the process-wide scheduler configured from GEMINI_API_KEYS and GEMINI_MODEL_TIERS.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(config.GEMINI_API_KEYS, config.GEMINI_MODEL_TIERS)
+            logger.info(
+                f"Gemini scheduler: {len(config.GEMINI_API_KEYS)} keys x "
+                f"{', '.join(tier['model'] for tier in config.GEMINI_MODEL_TIERS)}"
+            )
+        return _scheduler
@@ -0,0 +1,82 @@
+import random
+import threading
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+import config
+
+logger = logging.getLogger(__name__)
+
+# 这些状态码通常是暂时性的，值得重试
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Return the process-wide requests.Session with keep-alive connection pools per host.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=config.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=config.HTTP_POOL_MAXSIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            # 安装了 brotli 时 urllib3 会自动声明并解码 br
+            session.headers.update(make_headers(accept_encoding=True))
+            _session = session
+        return _session
+
+def _retry_delay(attempt, response=None):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), config.HTTP_MAX_BACKOFF_SECONDS)
+        except ValueError:
+            pass
+    # 指数退避 + 抖动，避免多个线程同时重试
+    delay = config.HTTP_BACKOFF_SECONDS * (2 ** attempt)
+    return min(delay * random.uniform(0.5, 1.5), config.HTTP_MAX_BACKOFF_SECONDS)
+
+def request(method, url, retries=None, **kwargs):
+    """
+    Send a request through the shared session with default timeouts and
+    jittered exponential-backoff retries on connection errors and transient statuses.
+    The last response is returned even if its status is still an error.
+    """
+    retries = config.HTTP_RETRIES if retries is None else retries
+    kwargs.setdefault("timeout", config.HTTP_TIMEOUT)
+    session = get_session()
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= retries:
+                raise
+            delay = _retry_delay(attempt)
+            logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            delay = _retry_delay(attempt, response)
+            logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s...")
+            response.close()
+            time.sleep(delay)
+            continue
+
+        return response
+
+def get(url, **kwargs):
+    """
+    GET through the shared session, see request().
+    """
+    return request("GET", url, **kwargs)
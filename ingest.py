@@ -1,64 +1,120 @@
+import asyncio
 import logging
-import time
-import random
 import os
-import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from firecrawl import FirecrawlApp
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api.formatters import TextFormatter
 import yt_dlp  # 必须安装: pip install yt-dlp
 import config
+import rate_limiter
+import content_cache
+import http_client
+import transcript_stats
+import subtitles
+import metrics
 
 logger = logging.getLogger(__name__)
 
-def get_article_content(url):
+_firecrawl_app = None
+_firecrawl_lock = threading.Lock()
+
+def get_firecrawl_app():
     """
-    Scrape article content using Firecrawl.
+    Return the process-wide FirecrawlApp instance.
     """
+    global _firecrawl_app
+    with _firecrawl_lock:
+        if _firecrawl_app is None:
+            _firecrawl_app = FirecrawlApp(api_key=config.FIRECRAWL_API_KEY)
+        return _firecrawl_app
+
+def can_scrape(url):
     if not config.FIRECRAWL_API_KEY:
         logger.error("FIRECRAWL_API_KEY not set.")
+        return False
+    logger.info(f"Scraping article: {url}")
+    return True
+
+def _scrape(app, url):
+    # 增加 timeout 选项 (如果 SDK 支持) 或仅保留 formats
+    return app.scrape_url(url, params={'formats': ['markdown']})
+
+def get_article_content(url):
+    """
+    Scrape article content using Firecrawl.
+    """
+    cached = content_cache.get("article", url)
+    if cached is not None:
+        return cached
+    if not can_scrape(url):
         return None
 
-    logger.info(f"Scraping article: {url}")
+    limiter = rate_limiter.get_limiter("firecrawl")
     try:
-        app = FirecrawlApp(api_key=config.FIRECRAWL_API_KEY)
-        # 增加 timeout 选项 (如果 SDK 支持) 或仅保留 formats
-        scrape_result = app.scrape_url(url, params={'formats': ['markdown']})
-        
-        # === 修改处：增强返回值的检查逻辑 ===
-        if scrape_result and 'markdown' in scrape_result:
-            content = scrape_result['markdown']
-            # 简单的长度检查，防止抓取到空页面
-            if len(content) < 100: 
-                logger.warning(f"Content too short for {url}, might be blocked or empty.")
-                return None
-            return content
-        else:
-            logger.warning(f"No markdown content found for {url}. Result keys: {scrape_result.keys() if scrape_result else 'None'}")
-            return None
+        app = get_firecrawl_app()
+        for attempt in range(config.RATE_LIMIT_MAX_RETRIES + 1):
+            limiter.acquire()
+            try:
+                scrape_result = _scrape(app, url)
+                break
+            except Exception as e:
+                if rate_limiter.should_retry(limiter, attempt, e):
+                    continue
+                raise
+
+        return article_from_result(url, scrape_result)
+    except Exception as e:
+        logger.error(f"Firecrawl scraping failed for {url}: {e}")
+        return None
+
+async def get_article_content_async(url):
+    """
+    get_article_content() for the asyncio mode: the Firecrawl SDK call and the cache
+    run on the loop's executor, rate-limit waits stay on the loop.
+    """
+    cached = await asyncio.to_thread(content_cache.get, "article", url)
+    if cached is not None:
+        return cached
+    if not can_scrape(url):
+        return None
+
+    limiter = rate_limiter.get_limiter("firecrawl")
+    try:
+        app = get_firecrawl_app()
+        for attempt in range(config.RATE_LIMIT_MAX_RETRIES + 1):
+            await limiter.acquire_async()
+            try:
+                scrape_result = await asyncio.to_thread(_scrape, app, url)
+                break
+            except Exception as e:
+                if rate_limiter.should_retry(limiter, attempt, e):
+                    continue
+                raise
+
+        return await asyncio.to_thread(article_from_result, url, scrape_result)
     except Exception as e:
         logger.error(f"Firecrawl scraping failed for {url}: {e}")
         return None
 
-def clean_vtt_text(vtt_content):
-    """
-    Helper function to clean VTT subtitle format to plain text.
-    """
-    lines = vtt_content.splitlines()
-    text_lines = []
-    # 简单的去重和清洗逻辑
-    seen = set()
-    for line in lines:
-        # 跳过时间轴 (e.g., 00:00:00.000 --> 00:00:05.000) 和 WEBVTT 头
-        if '-->' in line or line.strip() == 'WEBVTT' or not line.strip():
-            continue
-        # 去除 HTML 标签 (e.g., <c.colorE5E5E5>)
-        clean_line = re.sub(r'<[^>]+>', '', line).strip()
-        # 去除重复行 (歌词或字幕常有重复)
-        if clean_line and clean_line not in seen:
-            seen.add(clean_line)
-            text_lines.append(clean_line)
-    return " ".join(text_lines)
+def article_from_result(url, scrape_result):
+    """
+    Validate a Firecrawl scrape result, cache and return its markdown (None if unusable).
+    """
+    # === 修改处：增强返回值的检查逻辑 ===
+    if scrape_result and 'markdown' in scrape_result:
+        content = scrape_result['markdown']
+        # 简单的长度检查，防止抓取到空页面
+        if len(content) < 100: 
+            logger.warning(f"Content too short for {url}, might be blocked or empty.")
+            return None
+        content_cache.put("article", url, content)
+        return content
+    else:
+        logger.warning(f"No markdown content found for {url}. Result keys: {scrape_result.keys() if scrape_result else 'None'}")
+        return None
 
 def get_transcript_with_ytdlp(video_id, cookies_path):
     """
@@ -82,94 +138,292 @@ def get_transcript_with_ytdlp(video_id, cookies_path):
             info = ydl.extract_info(url, download=False)
             
             # 检查是否有字幕
-            subtitles = info.get('requested_subtitles')
-            if not subtitles:
+            requested = info.get('requested_subtitles')
+            if not requested:
                 # 尝试再次查找，有时候 yt-dlp 逻辑不一样
                 if 'en' in info.get('subtitles', {}):
-                    sub_url = info['subtitles']['en'][0]['url']
+                    sub_info = info['subtitles']['en'][0]
                 elif 'en' in info.get('automatic_captions', {}):
-                    sub_url = info['automatic_captions']['en'][0]['url']
+                    sub_info = info['automatic_captions']['en'][0]
                 else:
                     return None
             else:
                 # 优先取英文
-                if 'en' in subtitles:
-                    sub_url = subtitles['en']['url']
+                if 'en' in requested:
+                    sub_info = requested['en']
                 else:
                     # 取第一个可用的
-                    key = list(subtitles.keys())[0]
-                    sub_url = subtitles[key]['url']
+                    key = list(requested.keys())[0]
+                    sub_info = requested[key]
+            sub_url = sub_info['url']
             
             # 下载字幕内容
-            import requests
             # 这里的 sub_url 通常是 json3 或 vtt 格式，yt-dlp 获取的 url 可以直接下载
-            res = requests.get(sub_url)
+            res = http_client.get(sub_url)
             if res.status_code == 200:
-                # 简单清洗 VTT/JSON 格式 (这里假设是 VTT 或类文本)
-                return clean_vtt_text(res.text)
+                # 按扩展名解析 VTT / SRV3 / json3，未知时根据内容判断
+                return subtitles.subtitles_to_text(res.text, sub_info.get('ext'))
             
     except Exception as e:
         logger.error(f"yt-dlp fallback failed: {e}")
     
     return None
 
-def get_youtube_transcript(video_id):
+def get_transcript_with_api(video_id, cookies_path):
+    """
+    Primary method: youtube_transcript_api with cookies. Raises on failure.
+    """
+    transcript_list = YouTubeTranscriptApi.list_transcripts(video_id, cookies=cookies_path)
+    transcript = transcript_list.find_transcript(['en', 'en-US', 'en-GB'])
+    transcript_data = transcript.fetch()
+    formatter = TextFormatter()
+    return formatter.format_transcript(transcript_data)
+
+# 字幕获取策略，默认顺序即字典顺序，之后按历史成功率 / 延迟调整
+TRANSCRIPT_STRATEGIES = {
+    "transcript_api": get_transcript_with_api,
+    "ytdlp": get_transcript_with_ytdlp,
+}
+
+# 共享线程池：落败的策略无法强制中断，只能放弃其结果，线程数有上限防止堆积
+_transcript_executor = ThreadPoolExecutor(max_workers=config.TRANSCRIPT_MAX_WORKERS, thread_name_prefix="transcript")
+
+def run_transcript_strategy(name, video_id, cookies_path):
     """
-    Fetch YouTube transcript using Cookies, with yt-dlp fallback.
+    Run one transcript strategy, recording its outcome. Returns the transcript or None.
+    """
+    started = time.monotonic()
+    try:
+        content = TRANSCRIPT_STRATEGIES[name](video_id, cookies_path)
+    except Exception as e:
+        error_msg = str(e)
+        logger.warning(f"Transcript strategy {name} failed for {video_id}: {error_msg}")
+        rate_limited = "Too Many Requests" in error_msg
+        # 如果是 429 错误，记录严重警告，之后的视频会直接并行启动 fallback (yt-dlp 抗封锁能力更强)
+        if rate_limited:
+            logger.warning(f"Hit 429 Rate Limit on {name}.")
+            rate_limiter.get_limiter("youtube").penalize(rate_limiter.retry_after_seconds(e))
+        transcript_stats.record(name, False, time.monotonic() - started, rate_limited=rate_limited)
+        return None
+
+    transcript_stats.record(name, bool(content), time.monotonic() - started)
+    return content
+
+def transcript_plan(video_id):
+    """
+    Cookies file and strategy order for one transcript fetch: returns
+    (cookies_path, strategy names in preferred order, whether the first one was recently rate limited).
     """
     logger.info(f"Fetching transcript for video: {video_id}")
-    
     cookies_path = config.YOUTUBE_COOKIES_PATH
     if not os.path.exists(cookies_path):
         logger.warning(f"Cookies file not found at {cookies_path}, trying anonymous access.")
         cookies_path = None
 
-    # === 策略 1: 尝试 youtube_transcript_api ===
-    try:
-        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id, cookies=cookies_path)
-        transcript = transcript_list.find_transcript(['en', 'en-US', 'en-GB'])
-        transcript_data = transcript.fetch()
-        formatter = TextFormatter()
-        return formatter.format_transcript(transcript_data)
+    order = transcript_stats.preferred_order(list(TRANSCRIPT_STRATEGIES))
+    return cookies_path, order, bool(order) and transcript_stats.recently_rate_limited(order[0])
 
-    except Exception as e:
-        error_msg = str(e)
-        logger.warning(f"Standard API failed for {video_id}: {error_msg}")
-        
-        # 如果是 429 错误，记录严重警告，但继续尝试 fallback (yt-dlp 抗封锁能力更强)
-        if "Too Many Requests" in error_msg:
-            logger.warning("Hit 429 Rate Limit on standard API. Switching to yt-dlp immediately.")
-        
-        # === 策略 2: 启动 yt-dlp 兜底 ===
-        fallback_content = get_transcript_with_ytdlp(video_id, cookies_path)
-        if fallback_content:
-            logger.info(f"Successfully retrieved transcript using yt-dlp for {video_id}")
-            return fallback_content
+class TranscriptHedge:
+    """
+    Bookkeeping of one hedged transcript fetch, shared by the threaded and asyncio modes.
+    submit(fn, *args) starts a strategy and returns a future; the caller waits on
+    `pending` for at most timeout() seconds with its own primitive and hands the
+    finished futures to collect().
+    """
+    def __init__(self, video_id, cookies_path, order, primary_rate_limited, submit):
+        self.video_id = video_id
+        self.cookies_path = cookies_path
+        self.remaining = list(order)
+        self.deadline = time.monotonic() + config.TRANSCRIPT_DEADLINE_SECONDS
+        self.pending = {}
+        self.stopped = False
+        self._submit = submit
+
+        self.launch()
+        if self.remaining and primary_rate_limited:
+            logger.info(f"Primary strategy was recently rate limited, starting fallback in parallel for {video_id}.")
+            self.launch()
+
+    def launch(self):
+        name = self.remaining.pop(0)
+        self.pending[self._submit(run_transcript_strategy, name, self.video_id, self.cookies_path)] = name
+
+    def timeout(self):
+        """
+        Seconds to wait for the next result, or None when the fetch is over.
+        """
+        if self.stopped or not self.pending:
+            return None
+        timeout = self.deadline - time.monotonic()
+        if self.remaining:
+            timeout = min(timeout, config.TRANSCRIPT_HEDGE_DELAY_SECONDS)
+        return timeout if timeout > 0 else None
 
+    def collect(self, done):
+        """
+        Handle the futures finished within timeout(); returns the transcript once a strategy succeeds.
+        """
+        if not done:
+            # 对冲：主策略迟迟没有结果，启动下一个策略
+            if self.remaining and time.monotonic() < self.deadline:
+                self.launch()
+            else:
+                self.stopped = True
+            return None
+
+        for future in done:
+            name = self.pending.pop(future)
+            content = future.result()
+            if content:
+                logger.info(f"Successfully retrieved transcript using {name} for {self.video_id}")
+                self.give_up()
+                return content
+
+        # 当前策略全部失败，立即启动下一个
+        if not self.pending and self.remaining:
+            self.launch()
         return None
 
+    def give_up(self):
+        """
+        Cancel the strategies still running (a thread that already started cannot be interrupted).
+        """
+        for future in self.pending:
+            future.cancel()
+        self.pending = {}
+
+def get_youtube_transcript(video_id):
+    """
+    Fetch YouTube transcript with hedged strategies: the preferred strategy starts first,
+    the next one starts after TRANSCRIPT_HEDGE_DELAY_SECONDS (or immediately if the
+    preferred one failed or was recently rate limited); the first success wins.
+    """
+    cached = content_cache.get("transcript", video_id)
+    if cached is not None:
+        return cached
+
+    plan = transcript_plan(video_id)
+    rate_limiter.get_limiter("youtube").acquire()
+    hedge = TranscriptHedge(video_id, *plan, _transcript_executor.submit)
+
+    while True:
+        timeout = hedge.timeout()
+        if timeout is None:
+            break
+        done, _ = wait(hedge.pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        content = hedge.collect(done)
+        if content:
+            content_cache.put("transcript", video_id, content)
+            return content
+
+    return transcript_timed_out(hedge)
+
+async def get_youtube_transcript_async(video_id):
+    """
+    get_youtube_transcript() for the asyncio mode. The strategies (youtube_transcript_api,
+    yt-dlp) are blocking and run on the shared transcript executor; hedging and the
+    deadline are driven by the event loop.
+    """
+    cached = await asyncio.to_thread(content_cache.get, "transcript", video_id)
+    if cached is not None:
+        return cached
+
+    plan = await asyncio.to_thread(transcript_plan, video_id)
+    await rate_limiter.get_limiter("youtube").acquire_async()
+    loop = asyncio.get_running_loop()
+    hedge = TranscriptHedge(video_id, *plan, lambda *args: loop.run_in_executor(_transcript_executor, *args))
+
+    while True:
+        timeout = hedge.timeout()
+        if timeout is None:
+            break
+        done, _ = await asyncio.wait(hedge.pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        content = hedge.collect(done)
+        if content:
+            await asyncio.to_thread(content_cache.put, "transcript", video_id, content)
+            return content
+
+    return transcript_timed_out(hedge)
+
+def transcript_timed_out(hedge):
+    if hedge.pending:
+        logger.warning(f"Transcript deadline of {config.TRANSCRIPT_DEADLINE_SECONDS}s exceeded for {hedge.video_id}.")
+    hedge.give_up()
+    return None
+
+def scrape_article_timed(item):
+    with metrics.span("ingest", item['title']) as record:
+        content = get_article_content(item['url'])
+        record_content(record, content)
+        return content
+
+def scrape_articles(items):
+    """
+    Scrape all article items concurrently and yield (item, content) as each one completes.
+    Items are submitted in the given (priority) order; content is None when scraping failed.
+    Closing the generator early cancels the scrapes that have not started yet.
+    """
+    executor = ThreadPoolExecutor(max_workers=config.FIRECRAWL_BATCH_CONCURRENCY, thread_name_prefix="firecrawl")
+    try:
+        futures = {executor.submit(scrape_article_timed, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                content = future.result()
+            except Exception as e:
+                logger.error(f"Firecrawl scraping failed for {item['url']}: {e}")
+                content = None
+            yield item, content
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def is_article(item):
+    return item.get('source_type') in ('rss', 'website')
+
 def ingest_content(discovery_item):
     """
-    Dispatcher function with Rate Limiting for YouTube.
+    Dispatcher function. Rate limiting is handled per provider by rate_limiter.
     """
     item = discovery_item.copy()
     content = None
     
     source_type = item.get('source_type')
 
-    if source_type == 'rss' or source_type == 'website':
-        # 这里会自动调用 get_article_content，它使用 Firecrawl
-        # Dwarkesh 的 RSS url 会指向他的官网文章页，Firecrawl 能很好地处理这些页面
-        content = get_article_content(item['url'])
-        
-    elif source_type == 'youtube':
-        content = get_youtube_transcript(item['video_id'])
-        
-        # 即使失败了也要 sleep，防止死循环轰炸
-        sleep_time = random.uniform(20, 40) 
-        logger.info(f"YouTube rate limiting: Sleeping for {sleep_time:.2f} seconds...")
-        time.sleep(sleep_time)
+    with metrics.span("ingest", item['title']) as record:
+        if is_article(item):
+            # 这里会自动调用 get_article_content，它使用 Firecrawl
+            # Dwarkesh 的 RSS url 会指向他的官网文章页，Firecrawl 能很好地处理这些页面
+            content = get_article_content(item['url'])
+            
+        elif source_type == 'youtube':
+            content = get_youtube_transcript(item['video_id'])
+
+        record_content(record, content)
         
+    return with_content(item, content)
+
+async def ingest_content_async(discovery_item):
+    """
+    ingest_content() for the asyncio mode.
+    """
+    item = discovery_item.copy()
+    content = None
+
+    with metrics.span("ingest", item['title']) as record:
+        if is_article(item):
+            content = await get_article_content_async(item['url'])
+        elif item.get('source_type') == 'youtube':
+            content = await get_youtube_transcript_async(item['video_id'])
+
+        record_content(record, content)
+
+    return with_content(item, content)
+
+def record_content(record, content):
+    record["ok"] = content is not None
+    record["chars"] = len(content) if content else 0
+
+def with_content(item, content):
     if content:
         item['content'] = content
         return item
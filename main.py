@@ -1,10 +1,17 @@
+import asyncio
 import logging
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import discovery
-import ingest
-import analyzer
+import dedup
+import priority
 import notifier
-import time  # <--- 新增
+import pipeline
+import seen_store
+import analysis_cache
+import checkpoint
+import metrics
+import config
 
 # Configure logging
 logging.basicConfig(
@@ -20,60 +27,88 @@ logger = logging.getLogger(__name__)
 def main():
     parser = argparse.ArgumentParser(description="Daily AI Investment Insider Aggregator")
     parser.add_argument("--dry-run", action="store_true", help="Run without sending email")
+    parser.add_argument("--resume", action="store_true", help="Continue the last unfinished run from its checkpoint")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="Run discovery, ingest, analysis and email on one asyncio event loop")
     args = parser.parse_args()
 
-    logger.info("Starting Daily AI Investment Aggregator...")
+    if not args.async_mode:
+        run(args)
+        return
+    # 整个运行共用一个事件循环；阻塞库 (requests、yt-dlp、Firecrawl、smtplib) 在有界线程池中执行
+    with asyncio.Runner() as runner:
+        runner.get_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=config.ASYNC_EXECUTOR_WORKERS, thread_name_prefix="async-io")
+        )
+        run(args, runner)
+
+def run(args, runner=None):
+    """
+    Run the phases and always write the run report, also on idle days and failed runs.
+    """
+    try:
+        run_phases(args, runner)
+    finally:
+        report_path = metrics.write_report()
+        logger.info(f"Run report written to {report_path}\n{metrics.format_summary_table()}")
+    logger.info("Job complete.")
+
+def run_phases(args, runner=None):
+    """
+    Discovery, ingest & analysis, then notification. With a runner (--async) each phase
+    runs on its asyncio event loop.
+    """
+    logger.info(f"Starting Daily AI Investment Aggregator{' (async mode)' if runner else ''}...")
+    # 运行截止时间从启动开始计算，Discovery 的耗时也计入
+    budget = priority.RunBudget(config.RUN_DEADLINE_MINUTES, config.RUN_MAX_ANALYZED_ITEMS)
 
     # 1. Discovery
     logger.info("Phase 1: Discovery")
-    items = discovery.discover_content()
+    items = checkpoint.start(args.resume)
+    if items is None:
+        # 同一内容出现在多个源时只抓取、分析一次，之后按优先级从高到低处理
+        discovered = runner.run(discovery.discover_content_async()) if runner else discovery.discover_content()
+        items = priority.prioritize(dedup.dedupe_items(discovered))
+        checkpoint.save_discovery(items)
     if not items:
         logger.info("No new content found. Exiting.")
         return
 
     # 2. Ingest & Analyze
     logger.info("Phase 2: Ingest & Analyze")
-    analyzed_items = []
-    
-    # 统计成功处理的个数，用于控制频率
-    processed_count = 0
-
-    for item in items:
-        # Ingest
-        item_with_content = ingest.ingest_content(item)
-        if not item_with_content:
-            continue
-            
-        # Analyze
-        analyzed_item = analyzer.analyze_content(item_with_content)
-        if analyzed_item:
-            analyzed_items.append(analyzed_item)
-            processed_count += 1
-            
-            # === 核心修改：Gemini Free Tier 限流保护 ===
-            # 限制为 2 RPM (每分钟2次)，所以每次成功后暂停 35 秒
-            logger.info("Sleeping 35s to respect Gemini Free Tier rate limits...")
-            time.sleep(35) 
-            
-        else:
-            logger.warning(f"Skipping {item['title']} due to analysis failure.")
+    # 每个条目分析完成即渲染报告片段
+    report = notifier.ReportBuilder()
+    if runner:
+        analyzed_items = runner.run(pipeline.run_pipeline_async(items, budget, on_analyzed=report.add))
+    else:
+        analyzed_items = pipeline.run_pipeline(items, budget, on_analyzed=report.add)
+    cache_stats = analysis_cache.stats()
+    logger.info(f"Analysis cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses.")
 
     # 3. Notify
     logger.info("Phase 3: Notify")
     if analyzed_items:
-        html_report = notifier.generate_html_report(analyzed_items)
-        
         if args.dry_run:
             logger.info("Dry run enabled. Saving report to disk.")
-            with open("dry_run_report.html", "w", encoding="utf-8") as f:
-                f.write(html_report)
+            report.write("dry_run_report.html")
         else:
             subject = f"AI Investment Insider - {len(analyzed_items)} New Updates"
-            notifier.send_email(subject, html_report)
+            with metrics.span("notify", subject) as record:
+                if runner:
+                    delivered = runner.run(notifier.send_report_async(subject, report))
+                else:
+                    delivered = notifier.send_report(subject, report)
+                record["ok"] = len(delivered) == len(analyzed_items)
+            logger.info(f"Report archived to {report.write(notifier.archive_path())}")
+            # 只有送达所有相关收件人后才记为已处理，发送失败的条目下次会重新处理
+            for delivered_item in report.items(delivered):
+                seen_store.mark_done(delivered_item)
+            if len(delivered) == len(analyzed_items):
+                checkpoint.finish()
+            elif delivered:
+                logger.warning(f"{len(analyzed_items) - len(delivered)} items were not delivered to every recipient.")
     else:
         logger.info("No items successfully analyzed.")
 
-    logger.info("Job complete.")
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+import config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_spans = []
+# counters[name][key] -> value，例如 counters["cache_hits"]["feed"]
+_counters = defaultdict(lambda: defaultdict(float))
+_run_started = time.time()
+
+@contextmanager
+def span(stage, name):
+    """
+    Time one unit of work (a source, an item, an email) within a pipeline stage.
+    Yields a dict callers can annotate; set record["ok"] = False and record["error"]
+    for failures that do not raise.
+    """
+    record = {"stage": stage, "name": name, "start": time.time(), "ok": True}
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        # 包括 asyncio 任务被取消 (CancelledError)，如超出 Discovery 时间预算的源
+        record["ok"] = False
+        record.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        record["duration"] = round(time.perf_counter() - started, 3)
+        with _lock:
+            _spans.append(record)
+
+def incr(name, key="total", value=1):
+    """
+    Add value to counter name[key], e.g. incr("bytes_fetched", "rss", 2048).
+    """
+    with _lock:
+        _counters[name][key] += value
+
+def summary():
+    """
+    Aggregate spans per stage and return them together with all counters.
+    """
+    with _lock:
+        spans = list(_spans)
+        counters = {name: dict(values) for name, values in _counters.items()}
+
+    stages = {}
+    windows = {}
+    for record in spans:
+        stage = stages.setdefault(record["stage"], {"count": 0, "failed": 0, "total_seconds": 0.0, "max_seconds": 0.0, "slowest": None})
+        stage["count"] += 1
+        stage["total_seconds"] += record["duration"]
+        if not record["ok"]:
+            stage["failed"] += 1
+        if record["duration"] >= stage["max_seconds"]:
+            stage["max_seconds"] = record["duration"]
+            stage["slowest"] = record["name"]
+        # 阶段内的 span 并发执行，吞吐量按第一个开始到最后一个结束的时间计算
+        first, last = windows.get(record["stage"], (record["start"], record["start"]))
+        windows[record["stage"]] = (min(first, record["start"]), max(last, record["start"] + record["duration"]))
+
+    for name, (first, last) in windows.items():
+        stages[name]["wall_seconds"] = round(last - first, 3)
+
+    return {
+        "started_at": _run_started,
+        "wall_seconds": round(time.time() - _run_started, 3),
+        "stages": stages,
+        "counters": counters,
+    }
+
+def write_report():
+    """
+    Write every span as a JSONL line followed by a summary line; returns the report path.
+    """
+    os.makedirs(config.RUN_REPORT_DIR, exist_ok=True)
+    path = os.path.join(
+        config.RUN_REPORT_DIR,
+        time.strftime("run-%Y%m%d-%H%M%S.jsonl", time.localtime(_run_started))
+    )
+    with _lock:
+        spans = list(_spans)
+    with open(path, "w", encoding="utf-8") as f:
+        for record in spans:
+            f.write(json.dumps({"type": "span", **record}, ensure_ascii=False) + "\n")
+        f.write(json.dumps({"type": "summary", **summary()}, ensure_ascii=False) + "\n")
+    return path
+
+def format_summary_table():
+    """
+    Render the run summary as a plain-text table.
+    """
+    data = summary()
+    lines = [
+        f"Run summary ({data['wall_seconds']:.1f}s wall)",
+        f"{'stage':<12}{'count':>7}{'failed':>8}{'total s':>10}{'max s':>9}  slowest",
+    ]
+    for stage, values in data["stages"].items():
+        lines.append(
+            f"{stage:<12}{values['count']:>7}{values['failed']:>8}"
+            f"{values['total_seconds']:>10.1f}{values['max_seconds']:>9.1f}  {values['slowest']}"
+        )
+    for name, values in sorted(data["counters"].items()):
+        parts = ", ".join(f"{key}={value:g}" for key, value in sorted(values.items()))
+        lines.append(f"{name}: {parts}")
+    return "\n".join(lines)
@@ -1,102 +1,377 @@
+import asyncio
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import datetime
+import html
+import os
+import random
+import threading
+import time
 import logging
+from string import Template
 import config
 
 logger = logging.getLogger(__name__)
 
-def generate_html_report(items):
-    """
-    Generate an HTML email body from the analyzed items.
-    """
-    date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-    
-    html_content = f"""
+# 样式只定义一次；邮件客户端不加载外部 CSS，仍需放在 <style> 中
+_STYLE = """
+            body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+            .container { max-width: 800px; margin: 0 auto; padding: 20px; }
+            .header { background-color: #2c3e50; color: #fff; padding: 20px; text-align: center; border-radius: 5px 5px 0 0; }
+            .section { color: #2c3e50; border-bottom: 2px solid #2c3e50; padding-bottom: 4px; margin-top: 30px; }
+            .item { border: 1px solid #ddd; margin-bottom: 20px; padding: 20px; border-radius: 5px; background-color: #f9f9f9; }
+            .item h2 { margin-top: 0; color: #2980b9; }
+            .meta { font-size: 0.9em; color: #7f8c8d; margin-bottom: 10px; }
+            .category { display: inline-block; background-color: #e74c3c; color: #fff; padding: 2px 8px; border-radius: 3px; font-size: 0.8em; }
+            .insight { background-color: #e8f6f3; border-left: 4px solid #1abc9c; padding: 10px; margin-top: 10px; }
+            .footer { text-align: center; font-size: 0.8em; color: #7f8c8d; margin-top: 30px; }
+"""
+
+# string.Template 的 $ 占位符不会与 CSS 的花括号冲突，无需额外依赖模板引擎
+_PAGE_HEAD = Template("""
     <html>
     <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 800px; margin: 0 auto; padding: 20px; }}
-            .header {{ background-color: #2c3e50; color: #fff; padding: 20px; text-align: center; border-radius: 5px 5px 0 0; }}
-            .item {{ border: 1px solid #ddd; margin-bottom: 20px; padding: 20px; border-radius: 5px; background-color: #f9f9f9; }}
-            .item h2 {{ margin-top: 0; color: #2980b9; }}
-            .meta {{ font-size: 0.9em; color: #7f8c8d; margin-bottom: 10px; }}
-            .category {{ display: inline-block; background-color: #e74c3c; color: #fff; padding: 2px 8px; border-radius: 3px; font-size: 0.8em; }}
-            .insight {{ background-color: #e8f6f3; border-left: 4px solid #1abc9c; padding: 10px; margin-top: 10px; }}
-            .footer {{ text-align: center; font-size: 0.8em; color: #7f8c8d; margin-top: 30px; }}
-        </style>
+        <meta charset="utf-8">
+        <style>$style</style>
     </head>
     <body>
         <div class="container">
             <div class="header">
                 <h1>Daily AI Investment Insider</h1>
-                <p>{date_str}</p>
+                <p>$date</p>
             </div>
-    """
-    
-    if not items:
-        html_content += "<p>No new updates found in the last 24 hours.</p>"
-    else:
-        for item in items:
-            # Fallback if analysis failed but we still want to show the link
-            title = item.get('title_cn', item.get('title', 'Unknown Title'))
-            summary = item.get('summary_cn', 'No summary available.')
-            insight = item.get('key_insight', '')
-            category = item.get('category', 'General')
-            source = item.get('source_name', 'Unknown Source')
-            url = item.get('url', '#')
-            
-            html_content += f"""
+""")
+
+_SECTION = Template("""
+            <h2 class="section">$category</h2>
+""")
+
+_ITEM = Template("""
             <div class="item">
-                <h2><a href="{url}" style="text-decoration: none; color: #2980b9;">{title}</a></h2>
+                <h2><a href="$url" style="text-decoration: none; color: #2980b9;">$title</a></h2>
                 <div class="meta">
-                    <span class="category">{category}</span> | Source: {source}
+                    <span class="category">$category</span> | Source: $sources
                 </div>
-                <p>{summary}</p>
-                {f'<div class="insight"><strong>💡 Investment Insight:</strong> {insight}</div>' if insight else ''}
+                <p>$summary</p>
+                $insight
             </div>
-            """
-            
-    html_content += """
+""")
+
+_INSIGHT = Template('<div class="insight"><strong>💡 Investment Insight:</strong> $insight</div>')
+
+_SOURCE_LINK = Template('<a href="$url" style="color: #7f8c8d;">$name</a>')
+
+_EMPTY = """
+            <p>No new updates found in the last 24 hours.</p>
+"""
+
+_PAGE_FOOT = """
             <div class="footer">
                 <p>Generated by AI Investment Aggregator</p>
             </div>
         </div>
     </body>
     </html>
+"""
+
+def _safe_url(url):
+    # 只允许 http(s) 链接，并转义引号
+    if not url or not str(url).lower().startswith(("http://", "https://")):
+        return "#"
+    return html.escape(str(url), quote=True)
+
+def render_item(item):
+    """
+    Render the HTML fragment of one analyzed item, with every field escaped.
     """
-    
-    return html_content
+    # Fallback if analysis failed but we still want to show the link
+    title = item.get('title_cn', item.get('title', 'Unknown Title'))
+    summary = item.get('summary_cn', 'No summary available.')
+    insight = item.get('key_insight', '')
+
+    # 跨源去重合并的其他来源
+    sources = [html.escape(item.get('source_name', 'Unknown Source'))]
+    for duplicate in item.get('duplicates', []):
+        sources.append(_SOURCE_LINK.substitute(
+            url=_safe_url(duplicate.get('url')),
+            name=html.escape(duplicate.get('source_name', 'Unknown Source'))
+        ))
+
+    return _ITEM.substitute(
+        url=_safe_url(item.get('url')),
+        title=html.escape(str(title)),
+        category=html.escape(str(item.get('category', 'General'))),
+        sources=" · ".join(sources),
+        summary=html.escape(str(summary)),
+        insight=_INSIGHT.substitute(insight=html.escape(str(insight))) if insight else "",
+    )
 
-def send_email(subject, html_body):
+class ReportBuilder:
     """
-    Send the email using SMTP.
+    Incremental HTML report: each item is rendered as soon as its analysis completes
+    and the fragments are cached; the page is assembled once, grouped by category.
     """
-    if not config.EMAIL_PASSWORD or not config.EMAIL_SENDER or not config.EMAIL_RECIPIENT:
-        logger.warning("Email configuration missing. Skipping email send.")
-        # For debugging/dry-run, write to file
-        with open("latest_report.html", "w", encoding="utf-8") as f:
-            f.write(html_body)
-        logger.info("Saved email to latest_report.html")
-        return
+    def __init__(self, date_str=None):
+        self.date_str = date_str or datetime.datetime.now().strftime("%Y-%m-%d")
+        self._fragments = {}
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def add(self, index, item):
+        """
+        Render and cache the fragment of the item at position index (re-adding replaces it).
+        """
+        fragment = render_item(item)
+        category = str(item.get('category', 'General'))
+        with self._lock:
+            self._fragments[index] = (category, fragment)
+            self._items[index] = item
+
+    def indexes(self, categories=None):
+        """
+        Positions of the rendered items, optionally only those in categories.
+        """
+        with self._lock:
+            return {
+                index for index, (category, _) in self._fragments.items()
+                if categories is None or category in categories
+            }
+
+    def items(self, indexes=None):
+        """
+        The added items in position order, optionally only those at indexes.
+        """
+        with self._lock:
+            return [item for index, item in sorted(self._items.items()) if indexes is None or index in indexes]
+
+    def count(self, categories=None):
+        """
+        Number of rendered items, optionally only those in categories.
+        """
+        with self._lock:
+            return sum(1 for category, _ in self._fragments.values() if categories is None or category in categories)
+
+    def iter_html(self, categories=None):
+        """
+        Yield the page in chunks: head, one section per category (REPORT_CATEGORY_ORDER
+        first), footer. Items keep their position order within a category.
+        categories optionally limits the page to those categories (per-segment digests).
+        """
+        with self._lock:
+            fragments = sorted(self._fragments.items())
+
+        sections = {}
+        for _, (category, fragment) in fragments:
+            if categories is None or category in categories:
+                sections.setdefault(category, []).append(fragment)
+
+        order = [category for category in config.REPORT_CATEGORY_ORDER if category in sections]
+        order += sorted(category for category in sections if category not in config.REPORT_CATEGORY_ORDER)
+
+        yield _PAGE_HEAD.substitute(style=_STYLE, date=html.escape(self.date_str))
+        if not sections:
+            yield _EMPTY
+        for category in order:
+            yield _SECTION.substitute(category=html.escape(category))
+            yield from sections[category]
+        yield _PAGE_FOOT
+
+    def render(self, categories=None):
+        return "".join(self.iter_html(categories))
+
+    def write(self, path):
+        """
+        Stream the page to path chunk by chunk (written to a temp file, then renamed).
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in self.iter_html():
+                f.write(chunk)
+        os.replace(tmp_path, path)
+        return path
+
+def generate_html_report(items):
+    """
+    Generate an HTML email body from the analyzed items.
+    """
+    builder = ReportBuilder()
+    for index, item in enumerate(items):
+        builder.add(index, item)
+    return builder.render()
 
+def archive_path(date_str=None):
+    """
+    Path of the archived copy of today's report.
+    """
+    date_str = date_str or datetime.datetime.now().strftime("%Y-%m-%d")
+    return os.path.join(config.REPORT_ARCHIVE_DIR, f"report-{date_str}.html")
+
+def _is_transient(exc):
+    """
+    4xx replies, dropped connections and network errors are worth retrying;
+    authentication failures, unsupported extensions (STARTTLS / AUTH) and 5xx replies are not.
+    """
+    # SMTPNotSupportedError 也继承自 OSError，需在下面的判断之前排除
+    if isinstance(exc, (smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError)):
+        return False
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return any(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    # SMTPServerDisconnected / SMTPConnectError / socket 错误都继承自 OSError
+    return isinstance(exc, OSError)
+
+class SMTPSession:
+    """
+    One authenticated SMTP connection reused for every message. Reconnects after a drop
+    and retries transient failures with exponential backoff.
+    """
+    def __init__(self):
+        self._server = None
+        self.connections = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=config.SMTP_TIMEOUT)
+        try:
+            if config.SMTP_STARTTLS:
+                server.starttls()
+            server.login(config.EMAIL_SENDER, config.EMAIL_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self.connections += 1
+
+    def send(self, msg, recipients):
+        """
+        Send msg to recipients (envelope addresses). Returns True only if the server
+        accepted it for every recipient.
+        """
+        for attempt in range(config.SMTP_RETRIES + 1):
+            try:
+                if self._server is None:
+                    self._connect()
+                refused = self._server.send_message(msg, from_addr=config.EMAIL_SENDER, to_addrs=recipients)
+                if refused:
+                    # 部分收件人被拒收：这批邮件不算送达
+                    logger.error(f"Recipients refused: {', '.join(refused)}")
+                    return False
+                return True
+            except Exception as e:
+                if attempt >= config.SMTP_RETRIES or not _is_transient(e):
+                    logger.error(f"Failed to send email to {', '.join(recipients)}: {e}")
+                    return False
+                delay = config.SMTP_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"SMTP error ({e}), retrying in {delay:.1f}s...")
+                # 连接状态未知，重新建立
+                self.close()
+                time.sleep(delay)
+        return False
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _build_message(subject, html_body, to_header):
     msg = MIMEMultipart()
     msg['From'] = config.EMAIL_SENDER
-    msg['To'] = config.EMAIL_RECIPIENT
+    msg['To'] = to_header
     msg['Subject'] = subject
-    
     msg.attach(MIMEText(html_body, 'html'))
-    
-    try:
-        # Assuming Gmail for now, but this should be configurable
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(config.EMAIL_SENDER, config.EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(config.EMAIL_SENDER, config.EMAIL_RECIPIENT, text)
-        server.quit()
-        logger.info("Email sent successfully.")
-    except Exception as e:
-        logger.error(f"Failed to send email: {e}")
+    return msg
+
+def _batches(recipients):
+    size = max(1, config.EMAIL_BATCH_SIZE)
+    for start in range(0, len(recipients), size):
+        yield recipients[start:start + size]
+
+def send_digests(subject, digests):
+    """
+    Deliver (html_body, recipients) digests over one SMTP connection, in batches of
+    EMAIL_BATCH_SIZE recipients per message (a batch of one is addressed to the
+    recipient, larger batches are sent to the sender with the recipients as BCC).
+    Returns one flag per digest: True if every message of that digest was accepted
+    (all False when email is not configured).
+    """
+    recipients_configured = any(recipients for _, recipients in digests)
+    if not config.EMAIL_PASSWORD or not config.EMAIL_SENDER or not recipients_configured:
+        logger.warning("Email configuration missing. Skipping email send.")
+        # For debugging/dry-run, write to file
+        if digests:
+            with open("latest_report.html", "w", encoding="utf-8") as f:
+                f.write(digests[0][0])
+            logger.info("Saved email to latest_report.html")
+        return [False] * len(digests)
+
+    results = []
+    delivered, failed = 0, 0
+    with SMTPSession() as session:
+        for html_body, recipients in digests:
+            ok = True
+            for batch in _batches(recipients):
+                to_header = batch[0] if len(batch) == 1 else config.EMAIL_SENDER
+                if session.send(_build_message(subject, html_body, to_header), batch):
+                    delivered += 1
+                else:
+                    failed += 1
+                    ok = False
+            results.append(ok)
+
+    logger.info(f"Email delivery: {delivered} messages sent, {failed} failed, over {session.connections} connection(s).")
+    return results
+
+def send_email(subject, html_body, recipients=None):
+    """
+    Send the email using SMTP (to EMAIL_RECIPIENTS by default). Returns True if it was
+    delivered to every recipient.
+    """
+    return all(send_digests(subject, [(html_body, list(recipients or config.EMAIL_RECIPIENTS))]))
+
+def send_report(subject, report):
+    """
+    Send a ReportBuilder as one digest per EMAIL_SEGMENTS entry (each with its own
+    recipients and categories), or as one digest to EMAIL_RECIPIENTS.
+    Segments with no matching items are skipped.
+    Returns the report indexes of the items that reached every recipient meant to get
+    them; items of a segment with any failed message are left out.
+    """
+    segments = config.EMAIL_SEGMENTS or {"all": {"recipients": config.EMAIL_RECIPIENTS, "categories": None}}
+    digests, digest_categories = [], []
+    for name, segment in segments.items():
+        categories = segment.get("categories")
+        if not report.count(categories):
+            logger.info(f"No items for email segment {name}, skipping.")
+            continue
+        digests.append((report.render(categories), list(segment["recipients"])))
+        digest_categories.append(categories)
+
+    if not digests:
+        # 没有任何分组需要这些条目，视为已处理
+        return report.indexes()
+    delivered = report.indexes()
+    for categories, ok in zip(digest_categories, send_digests(subject, digests)):
+        if not ok:
+            delivered -= report.indexes(categories)
+    return delivered
+
+async def send_report_async(subject, report):
+    """
+    send_report() for the asyncio mode. smtplib is blocking, so the whole SMTP session
+    runs on the loop's executor (it is one connection either way).
+    """
+    return await asyncio.to_thread(send_report, subject, report)
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+import ingest
+import analyzer
+import seen_store
+import checkpoint
+import metrics
+import priority
+import config
+
+logger = logging.getLogger(__name__)
+
+# 通知 worker 退出的哨兵
+_DONE = object()
+# 分析队列按 (-优先级, 下标) 排序，哨兵排在所有条目之后
+_DONE_ENTRY = (float("inf"), float("inf"), _DONE)
+
+def _start_workers(name, count, target):
+    threads = [
+        threading.Thread(target=target, name=f"{name}-{i}")
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def _load_resume(on_analyzed):
+    """
+    Load checkpoint progress: returns (ingested, analyzed, resumed_jobs) where resumed_jobs
+    are items ingested but not yet analyzed. Already analyzed items are reported to on_analyzed.
+    """
+    # 断点续跑：已分析的直接复用，已抓取未分析的直接进入分析队列
+    ingested, analyzed = checkpoint.load_progress()
+    if on_analyzed:
+        for index, item in analyzed.items():
+            on_analyzed(index, item)
+    resumed_jobs = [(index, item) for index, item in sorted(ingested.items()) if index not in analyzed]
+    if analyzed or resumed_jobs:
+        logger.info(f"Checkpoint: {len(analyzed)} items already analyzed, {len(resumed_jobs)} already ingested.")
+    return ingested, analyzed, resumed_jobs
+
+def _claim(budget, jobs):
+    """
+    Reserve analysis budget for jobs; the jobs that did not fit are skipped.
+    """
+    # 预算用完后继续取出队列中的条目 (避免抓取端阻塞)，但不再分析
+    reason = budget.exhausted()
+    granted = 0 if reason else budget.reserve(len(jobs))
+    for _, skipped in jobs[granted:]:
+        budget.skip(skipped, reason or budget.exhausted() or "max_items")
+    return jobs[:granted]
+
+def _take_batch(budget, entry, get_nowait, empty_exc):
+    """
+    Drain a batch of jobs starting with the dequeued entry: returns (jobs, finished) where
+    jobs are the ones that got analysis budget and finished means the worker saw _DONE.
+    """
+    _, index, item = entry
+    if item is _DONE:
+        return [], True
+    # 把已排队的条目一起取出，合并成批量分析请求
+    jobs = [(index, item)]
+    finished = False
+    while config.ANALYSIS_BATCH_ENABLED and len(jobs) < config.ANALYSIS_BATCH_MAX_ITEMS:
+        try:
+            _, next_index, next_item = get_nowait()
+        except empty_exc:
+            break
+        if next_item is _DONE:
+            finished = True
+            break
+        jobs.append((next_index, next_item))
+    return _claim(budget, jobs), finished
+
+@contextmanager
+def _analysis_span(jobs):
+    """
+    Metrics span around the analysis of jobs; the body stores the per-job results
+    in outcome["analyzed"]. Unexpected errors fail every job instead of the worker.
+    """
+    outcome = {}
+    with metrics.span("analyze", " | ".join(item['title'] for _, item in jobs)) as record:
+        try:
+            yield outcome
+        except Exception as e:
+            logger.error(f"Unexpected analysis error: {e}")
+            outcome["analyzed"] = [None] * len(jobs)
+        record["items"] = len(jobs)
+        record["ok"] = all(outcome["analyzed"])
+
+def _ingest_failed(item, e):
+    logger.error(f"Unexpected ingest error for {item['title']}: {e}")
+    return None
+
+def _record_ingest(index, item, item_with_content):
+    """
+    Checkpoint an ingested item; returns False (after marking it failed) when ingest produced nothing.
+    """
+    if not item_with_content:
+        seen_store.mark_failed(item, "ingest")
+        return False
+    checkpoint.record_ingested(index, item_with_content)
+    return True
+
+def _record_analysis(jobs, analyzed, results, results_lock, on_analyzed):
+    for (index, item), analyzed_item in zip(jobs, analyzed):
+        if analyzed_item:
+            with results_lock:
+                results[index] = analyzed_item
+            if on_analyzed:
+                on_analyzed(index, analyzed_item)
+            # 正文已在 ingested 检查点中，这里不再重复保存
+            checkpoint.record_analyzed(index, {
+                key: value for key, value in analyzed_item.items() if key != 'content'
+            })
+        else:
+            logger.warning(f"Skipping {item['title']} due to analysis failure.")
+            seen_store.mark_failed(item, "analyze")
+
+def _analyze_workers():
+    return config.PIPELINE_ANALYZE_WORKERS or max(1, len(config.GEMINI_API_KEYS))
+
+def run_pipeline(items, budget=None, on_analyzed=None):
+    """
+    Run ingest and analyze as concurrent stages connected by a bounded queue,
+    so scraping of upcoming items overlaps the (rate-limited) analysis.
+    Items are expected highest priority first; ingested items wait for analysis in a
+    priority queue. Once the run budget is exhausted no new work is started.
+    Items already ingested or analyzed in the current checkpoint are not redone.
+    on_analyzed(index, item) is called as each item's analysis completes.
+    Returns the analyzed items in input order.
+    """
+    budget = budget or priority.RunBudget(config.RUN_DEADLINE_MINUTES, config.RUN_MAX_ANALYZED_ITEMS)
+    weights = priority.source_weights()
+    ingest_queue = queue.Queue()
+    # 有界优先队列：抓取最多领先分析 PIPELINE_QUEUE_SIZE 个条目，先分析优先级最高的
+    analyze_queue = queue.PriorityQueue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    results = {}
+    results_lock = threading.Lock()
+
+    def enqueue_analysis(index, item):
+        # 抓取后已知正文长度，重新计算优先级
+        item['priority'] = priority.score(item, weights)
+        analyze_queue.put((-item['priority'], index, item))
+
+    ingested, analyzed, resumed_jobs = _load_resume(on_analyzed)
+    results.update(analyzed)
+
+    # 文章走 Firecrawl 批量抓取，其余 (YouTube 等) 走 ingest worker
+    article_jobs = []
+    for index, item in enumerate(items):
+        if index in analyzed or index in ingested:
+            continue
+        if config.FIRECRAWL_BATCH_ENABLED and ingest.is_article(item):
+            article_jobs.append((index, item))
+        else:
+            ingest_queue.put((index, item))
+    for _ in range(config.PIPELINE_INGEST_WORKERS):
+        ingest_queue.put(_DONE)
+
+    def resumed_feeder():
+        for index, item in resumed_jobs:
+            enqueue_analysis(index, item)
+
+    def article_feeder():
+        positions = {id(item): index for index, item in article_jobs}
+        finished = set()
+        for item, content in ingest.scrape_articles([item for _, item in article_jobs]):
+            if content:
+                item_with_content = item.copy()
+                item_with_content['content'] = content
+                # 预算用完时也先保存已抓取的正文，续跑时不必重新付费抓取
+                checkpoint.record_ingested(positions[id(item)], item_with_content)
+            if budget.exhausted():
+                # 关闭生成器会取消尚未开始的抓取
+                break
+            finished.add(id(item))
+            if not content:
+                logger.warning(f"Failed to ingest content for {item['title']}")
+                seen_store.mark_failed(item, "ingest")
+                continue
+            enqueue_analysis(positions[id(item)], item_with_content)
+
+        for _, item in article_jobs:
+            if id(item) not in finished:
+                budget.skip(item, budget.exhausted())
+
+    def ingest_worker():
+        while True:
+            job = ingest_queue.get()
+            if job is _DONE:
+                return
+            index, item = job
+            reason = budget.exhausted()
+            if reason:
+                budget.skip(item, reason)
+                continue
+            try:
+                item_with_content = ingest.ingest_content(item)
+            except Exception as e:
+                item_with_content = _ingest_failed(item, e)
+
+            if _record_ingest(index, item, item_with_content):
+                enqueue_analysis(index, item_with_content)
+
+    def analyze_worker():
+        while True:
+            jobs, finished = _take_batch(budget, analyze_queue.get(), analyze_queue.get_nowait, queue.Empty)
+            if jobs:
+                with _analysis_span(jobs) as outcome:
+                    outcome["analyzed"] = analyzer.analyze_items([item for _, item in jobs])
+                _record_analysis(jobs, outcome["analyzed"], results, results_lock, on_analyzed)
+            if finished:
+                return
+
+    ingest_threads = _start_workers("ingest", config.PIPELINE_INGEST_WORKERS, ingest_worker)
+    if article_jobs:
+        ingest_threads += _start_workers("articles", 1, article_feeder)
+    if resumed_jobs:
+        ingest_threads += _start_workers("resumed", 1, resumed_feeder)
+    analyze_threads = _start_workers("analyze", _analyze_workers(), analyze_worker)
+
+    for thread in ingest_threads:
+        thread.join()
+    for _ in analyze_threads:
+        analyze_queue.put(_DONE_ENTRY)
+    for thread in analyze_threads:
+        thread.join()
+
+    return [results[index] for index in sorted(results)]
+
+
+async def run_pipeline_async(items, budget=None, on_analyzed=None):
+    """
+    run_pipeline() for the asyncio mode: each item's ingest is a task on the event loop
+    (at most PIPELINE_INGEST_WORKERS transcripts and FIRECRAWL_BATCH_CONCURRENCY articles
+    at a time, in priority order) and analysis workers drain the same bounded priority queue.
+    """
+    budget = budget or priority.RunBudget(config.RUN_DEADLINE_MINUTES, config.RUN_MAX_ANALYZED_ITEMS)
+    weights = priority.source_weights()
+    analyze_queue = asyncio.PriorityQueue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    results = {}
+    results_lock = threading.Lock()
+
+    async def enqueue_analysis(index, item):
+        item['priority'] = priority.score(item, weights)
+        await analyze_queue.put((-item['priority'], index, item))
+
+    ingested, analyzed, resumed_jobs = await asyncio.to_thread(_load_resume, on_analyzed)
+    results.update(analyzed)
+
+    # asyncio.Semaphore 按等待顺序放行，任务按优先级顺序创建即按优先级抓取
+    article_slots = asyncio.Semaphore(config.FIRECRAWL_BATCH_CONCURRENCY)
+    ingest_slots = asyncio.Semaphore(config.PIPELINE_INGEST_WORKERS)
+
+    async def ingest_one(index, item):
+        is_batch_article = config.FIRECRAWL_BATCH_ENABLED and ingest.is_article(item)
+        # 入队也在信号量内完成，分析队列满时抓取随之暂停
+        async with article_slots if is_batch_article else ingest_slots:
+            reason = budget.exhausted()
+            if reason:
+                budget.skip(item, reason)
+                return
+            try:
+                item_with_content = await ingest.ingest_content_async(item)
+            except Exception as e:
+                item_with_content = _ingest_failed(item, e)
+
+            # 检查点每条 fsync，放到线程池执行
+            if await asyncio.to_thread(_record_ingest, index, item, item_with_content):
+                await enqueue_analysis(index, item_with_content)
+
+    async def analyze_worker():
+        while True:
+            jobs, finished = _take_batch(budget, await analyze_queue.get(), analyze_queue.get_nowait, asyncio.QueueEmpty)
+            if jobs:
+                with _analysis_span(jobs) as outcome:
+                    outcome["analyzed"] = await analyzer.analyze_items_async([item for _, item in jobs])
+                await asyncio.to_thread(_record_analysis, jobs, outcome["analyzed"], results, results_lock, on_analyzed)
+            if finished:
+                return
+
+    analyze_tasks = [asyncio.create_task(analyze_worker()) for _ in range(_analyze_workers())]
+    ingest_tasks = [asyncio.create_task(enqueue_analysis(index, item)) for index, item in resumed_jobs]
+    ingest_tasks += [
+        asyncio.create_task(ingest_one(index, item))
+        for index, item in enumerate(items)
+        if index not in analyzed and index not in ingested
+    ]
+
+    await asyncio.gather(*ingest_tasks)
+    for _ in analyze_tasks:
+        await analyze_queue.put(_DONE_ENTRY)
+    await asyncio.gather(*analyze_tasks)
+
+    return [results[index] for index in sorted(results)]
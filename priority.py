@@ -0,0 +1,120 @@
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from dateutil import parser as date_parser
+import config
+import gemini_scheduler
+import metrics
+import text_reduce
+
+logger = logging.getLogger(__name__)
+
+def source_weights():
+    """
+    Map source name -> weight from DATA_SOURCES ("weight" key, default DEFAULT_SOURCE_WEIGHT).
+    """
+    return {
+        source['name']: source.get('weight', config.DEFAULT_SOURCE_WEIGHT)
+        for sources in config.DATA_SOURCES.values()
+        for source in sources
+    }
+
+def _age_hours(item, now):
+    try:
+        published = date_parser.isoparse(item['published_at'])
+    except (KeyError, TypeError, ValueError):
+        return config.LOOKBACK_HOURS / 2
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    return max(0.0, (now - published).total_seconds() / 3600)
+
+def length_factor(item):
+    """
+    1.0 for substantial content, down to PRIORITY_MIN_LENGTH_FACTOR for teasers.
+    Neutral (1.0) before the content has been ingested.
+    """
+    content = item.get('content')
+    if not content:
+        return 1.0
+    tokens = text_reduce.count_tokens(content)
+    return max(config.PRIORITY_MIN_LENGTH_FACTOR, min(1.0, tokens / config.PRIORITY_FULL_LENGTH_TOKENS))
+
+def score(item, weights=None, now=None):
+    """
+    Priority of an item: source weight x type weight x recency x content length.
+    Items also found in other sources (see dedup) get PRIORITY_DUPLICATE_BONUS per extra source.
+    """
+    weights = weights if weights is not None else source_weights()
+    now = now or datetime.now(timezone.utc)
+
+    sources = [item] + item.get('duplicates', [])
+    weight = max(weights.get(source.get('source_name'), config.DEFAULT_SOURCE_WEIGHT) for source in sources)
+    weight += config.PRIORITY_DUPLICATE_BONUS * (len(sources) - 1)
+    type_weight = config.PRIORITY_TYPE_WEIGHTS.get(item.get('source_type'), 1.0)
+    # 半衰期衰减，但保留一半的基础分，避免旧的重要内容被新的次要内容完全压过
+    recency = 0.5 + 0.5 * 0.5 ** (_age_hours(item, now) / config.PRIORITY_RECENCY_HALF_LIFE_HOURS)
+
+    return round(weight * type_weight * recency * length_factor(item), 4)
+
+def prioritize(items):
+    """
+    Score items and return them highest priority first (stable for equal scores).
+    The score is stored in item['priority'].
+    """
+    weights = source_weights()
+    now = datetime.now(timezone.utc)
+    for item in items:
+        item['priority'] = score(item, weights, now)
+    ordered = sorted(items, key=lambda item: -item['priority'])
+    if ordered:
+        logger.info("Priority order: " + ", ".join(f"{item['title']} ({item['priority']})" for item in ordered))
+    return ordered
+
+class RunBudget:
+    """
+    Run-level deadline and analysis budget shared by the pipeline workers.
+    Once exhausted no new ingest or analysis is started; the remaining (lower priority)
+    items are left for the next run.
+    """
+    def __init__(self, deadline_minutes=None, max_items=None, started_at=None):
+        started_at = started_at if started_at is not None else time.monotonic()
+        self.deadline = started_at + deadline_minutes * 60 if deadline_minutes else None
+        self.max_items = max_items
+        self.analyzed = 0
+        self._reported = set()
+        self._lock = threading.Lock()
+
+    def exhausted(self):
+        """
+        Return the reason the budget is used up ('deadline' / 'max_items' / 'quota'), or None.
+        """
+        has_quota = gemini_scheduler.get_scheduler().has_quota()
+        with self._lock:
+            reason = None
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                reason = "deadline"
+            elif self.max_items is not None and self.analyzed >= self.max_items:
+                reason = "max_items"
+            elif not has_quota:
+                reason = "quota"
+            if reason and reason not in self._reported:
+                self._reported.add(reason)
+                logger.warning(f"Run budget exhausted ({reason}), remaining items are left for the next run.")
+            return reason
+
+    def reserve(self, count):
+        """
+        Claim up to count analysis slots; returns how many were granted.
+        """
+        with self._lock:
+            if self.max_items is None:
+                granted = count
+            else:
+                granted = max(0, min(count, self.max_items - self.analyzed))
+            self.analyzed += granted
+            return granted
+
+    def skip(self, item, reason):
+        logger.info(f"Skipping {item['title']} ({reason}).")
+        metrics.incr("skipped", reason)
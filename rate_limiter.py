@@ -0,0 +1,198 @@
+import asyncio
+import re
+import threading
+import time
+import logging
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+    Callers reserve tokens up front and sleep until their reservation is covered,
+    so concurrent callers are served in arrival order.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount=1):
+        """
+        Take amount tokens and return how many seconds the caller must wait.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.level -= amount
+            wait = -self.level / self.rate if self.level < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def wait_time(self, amount=1):
+        """
+        Seconds a reserve(amount) made now would have to wait, without reserving.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            shortfall = amount - self.level
+            wait = shortfall / self.rate if shortfall > 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def adjust(self, amount):
+        """
+        Correct an earlier reservation (positive gives tokens back, negative takes more).
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level + amount)
+
+    def block(self, seconds):
+        """
+        Pause the bucket for seconds, e.g. after a 429 with Retry-After.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            # 被限流后不允许立刻突发
+            self.level = min(self.level, 0.0)
+
+class RateLimiter:
+    """
+    Per-provider limiter combining a requests-per-minute and an optional tokens-per-minute bucket.
+    """
+    def __init__(self, name, rpm, tpm=None, burst=None):
+        self.name = name
+        self.requests = TokenBucket(rpm, burst)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.slept_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        wait = self.requests.reserve(1)
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait >= 1:
+            logger.info(f"Rate limiter [{self.name}]: sleeping {wait:.1f}s to stay within quota.")
+        return wait
+
+    def _slept(self, wait):
+        with self.lock:
+            self.slept_seconds += wait
+        metrics.incr("rate_limit_sleep_seconds", self.name, wait)
+
+    def acquire(self, tokens=0):
+        """
+        Block until one request (and tokens, if TPM-limited) fits in the quota.
+        Returns the number of seconds slept.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+            self._slept(wait)
+        return wait
+
+    async def acquire_async(self, tokens=0):
+        """
+        acquire() for the asyncio mode: waits without blocking the event loop.
+        Shares the buckets with acquire(), so both modes see one quota.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+            self._slept(wait)
+        return wait
+
+    def wait_time(self, tokens=0):
+        """
+        Seconds acquire(tokens) would sleep if called now.
+        """
+        wait = self.requests.wait_time(1)
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def record_tokens(self, estimated, actual):
+        """
+        Reconcile the token estimate passed to acquire() with the actual usage.
+        """
+        if self.tokens and actual is not None:
+            self.tokens.adjust(estimated - actual)
+
+    def penalize(self, seconds=None):
+        """
+        Honor a 429 / Retry-After signal from the provider.
+        """
+        seconds = seconds if seconds is not None else config.RATE_LIMIT_DEFAULT_BACKOFF_SECONDS
+        logger.warning(f"Rate limiter [{self.name}]: provider throttled us, pausing {seconds:.0f}s.")
+        metrics.incr("rate_limited", self.name)
+        self.requests.block(seconds)
+        if self.tokens:
+            self.tokens.block(seconds)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider):
+    """
+    Return the shared limiter for provider, configured from config.RATE_LIMITS.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limits = config.RATE_LIMITS[provider]
+            limiter = RateLimiter(provider, limits["rpm"], limits.get("tpm"), limits.get("burst"))
+            _limiters[provider] = limiter
+        return limiter
+
+def is_rate_limited(exc):
+    """
+    Detect 429 / quota errors from requests, Google API core and text-only SDK exceptions.
+    """
+    response = getattr(exc, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+    if getattr(exc, 'code', None) == 429:
+        return True
+    message = str(exc)
+    return "429" in message or "Too Many Requests" in message or "RESOURCE_EXHAUSTED" in message
+
+def should_retry(limiter, attempt, exc, max_retries=None):
+    """
+    Decide whether a failed attempt is retried: rate-limit errors are, while retries
+    remain (RATE_LIMIT_MAX_RETRIES), after pausing limiter for the suggested delay.
+    """
+    max_retries = config.RATE_LIMIT_MAX_RETRIES if max_retries is None else max_retries
+    if attempt >= max_retries or not is_rate_limited(exc):
+        return False
+    limiter.penalize(retry_after_seconds(exc))
+    return True
+
+def retry_after_seconds(exc):
+    """
+    Extract the server-suggested delay from a rate-limit exception, or None.
+    """
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+
+    # Gemini 在错误详情中返回 retry_delay { seconds: N }
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", str(exc))
+    if match:
+        return float(match.group(1))
+    return None
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+import time
+import os
+import logging
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# status: 'done' = 已成功分析并发送；'failed' = 抓取或分析失败，等待退避后重试
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_items (
+    item_key TEXT PRIMARY KEY,
+    url TEXT,
+    title TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_retry_at REAL,
+    updated_at REAL NOT NULL
+)
+"""
+
+_conn = None
+_lock = threading.Lock()
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(config.SEEN_DB_PATH), exist_ok=True)
+        _conn = sqlite3.connect(config.SEEN_DB_PATH, check_same_thread=False)
+        _conn.execute(_SCHEMA)
+        _conn.commit()
+    return _conn
+
+def item_key(item):
+    """
+    Stable identity for a discovered item: GUID, then video id, then URL.
+    """
+    return item.get('guid') or item.get('video_id') or item.get('url')
+
+def should_process(item, now=None):
+    """
+    Return True if the item has never been handled, or failed earlier and its backoff expired.
+    """
+    now = now if now is not None else time.time()
+    with _lock:
+        row = _get_conn().execute(
+            "SELECT status, attempts, next_retry_at FROM seen_items WHERE item_key = ?",
+            (item_key(item),)
+        ).fetchone()
+
+    if row is None:
+        return True
+
+    status, attempts, next_retry_at = row
+    if status == 'done':
+        return False
+    if attempts >= config.SEEN_MAX_ATTEMPTS:
+        return False
+    return next_retry_at is None or now >= next_retry_at
+
+def filter_new(items):
+    """
+    Drop items that were already processed or are still backing off after a failure.
+    """
+    new_items = []
+    keys = set()
+    for item in items:
+        key = item_key(item)
+        if key in keys:
+            continue
+        keys.add(key)
+        if should_process(item):
+            new_items.append(item)
+
+    skipped = len(items) - len(new_items)
+    if skipped:
+        logger.info(f"Seen store: skipped {skipped} already handled items, {len(new_items)} remaining.")
+    return new_items
+
+def _with_duplicates(item):
+    # 跨源去重后，其他源的同一内容随代表条目一起记录
+    return [item] + item.get('duplicates', [])
+
+def mark_done(item):
+    """
+    Record that an item (and its cross-source duplicates) was ingested, analyzed and delivered.
+    """
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        conn.executemany(
+            """
+            INSERT INTO seen_items (item_key, url, title, status, attempts, last_error, next_retry_at, updated_at)
+            VALUES (?, ?, ?, 'done', 0, NULL, NULL, ?)
+            ON CONFLICT(item_key) DO UPDATE SET
+                status = 'done', last_error = NULL, next_retry_at = NULL, updated_at = excluded.updated_at
+            """,
+            [(item_key(entry), entry.get('url'), entry.get('title'), now) for entry in _with_duplicates(item)]
+        )
+        conn.commit()
+
+def mark_failed(item, reason):
+    """
+    Record a failed attempt and schedule the next retry with exponential backoff.
+    Cross-source duplicates of the item share its backoff.
+    """
+    now = time.time()
+    key = item_key(item)
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute("SELECT attempts FROM seen_items WHERE item_key = ?", (key,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        next_retry_at = now + config.SEEN_RETRY_BASE_HOURS * 3600 * (2 ** (attempts - 1))
+        conn.executemany(
+            """
+            INSERT INTO seen_items (item_key, url, title, status, attempts, last_error, next_retry_at, updated_at)
+            VALUES (?, ?, ?, 'failed', ?, ?, ?, ?)
+            ON CONFLICT(item_key) DO UPDATE SET
+                status = 'failed', attempts = excluded.attempts, last_error = excluded.last_error,
+                next_retry_at = excluded.next_retry_at, updated_at = excluded.updated_at
+            """,
+            [
+                (item_key(entry), entry.get('url'), entry.get('title'), attempts, reason, next_retry_at, now)
+                for entry in _with_duplicates(item)
+            ]
+        )
+        conn.commit()
+    metrics.incr("failures", reason)
+    logger.info(f"Marked {item.get('title')} as failed ({reason}), attempt {attempts}.")
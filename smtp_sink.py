@@ -0,0 +1,123 @@
+import socketserver
+import sys
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP dialogue: accepts every sender and recipient and keeps the message.
+    AUTH is accepted without a credential check; STARTTLS is not offered.
+    """
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        sink.opened()
+        self.reply("220 smtp-sink ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb == "EHLO":
+                self.reply("250-smtp-sink")
+                self.reply("250-8BITMIME")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "HELO":
+                self.reply("250 smtp-sink")
+            elif verb == "STARTTLS":
+                # 本地 sink 不做加密，客户端需跳过 TLS 握手
+                self.reply("454 TLS not available on the sink")
+            elif verb == "AUTH":
+                self.reply("235 Authentication accepted")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip().strip("<>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip().strip("<>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    # 去掉 dot-stuffing
+                    if data_line.startswith(b".."):
+                        data_line = data_line[1:]
+                    lines.append(data_line)
+                sink.deliver(sender, recipients, b"".join(lines))
+                sender, recipients = None, []
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                # RFC 5321：NOOP 不改变当前的发件人和收件人
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class SMTPSink:
+    """
+    Local SMTP server that records delivered messages instead of sending them,
+    for benchmarks and manual delivery tests.
+    """
+    def __init__(self, host="127.0.0.1", port=0):
+        self.messages = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), _SinkHandler)
+        self._server.daemon_threads = True
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def opened(self):
+        with self._lock:
+            self.connections += 1
+
+    def deliver(self, sender, recipients, data):
+        with self._lock:
+            self.messages.append({"sender": sender, "recipients": recipients, "data": data})
+        logger.info(f"Sink received {len(data)} bytes from {sender} for {', '.join(recipients)}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    # python smtp_sink.py [端口]，在本地接收邮件并打印摘要
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1025
+    sink = SMTPSink(port=port).start()
+    host, port = sink.address
+    print(f"SMTP sink listening on {host}:{port}, Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        sink.stop()
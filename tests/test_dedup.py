@@ -0,0 +1,75 @@
+import dedup
+
+def item(title, source_name, url, published_at="2024-06-01T12:00:00+00:00", source_type="rss", **fields):
+    return dict(fields, title=title, source_name=source_name, url=url,
+                published_at=published_at, source_type=source_type)
+
+def clusters(items):
+    return sorted(sorted(members) for members in dedup.cluster(items))
+
+def test_shared_url_merges_items_with_different_titles():
+    items = [
+        item("Weekly Update", "Blog", "https://www.example.com/post/1?utm_source=rss"),
+        item("Something else entirely", "Newsletter", "https://example.com/post/1/"),
+    ]
+
+    assert clusters(items) == [[0, 1]]
+
+def test_similar_titles_from_different_sources_merge():
+    items = [
+        item("Ep 42: Jensen Huang on the future of AI compute", "Podcast RSS", "https://podcast.example.com/42"),
+        item("#42 Jensen Huang on the Future of AI Compute!", "Podcast YouTube", "https://www.youtube.com/watch?v=abc",
+             source_type="youtube", video_id="abc"),
+    ]
+
+    assert clusters(items) == [[0, 1]]
+
+    kept = dedup.dedupe_items(items)
+    assert len(kept) == 1
+    assert kept[0]["source_type"] == "youtube"
+    assert kept[0]["duplicates"][0]["source_name"] == "Podcast RSS"
+
+def test_similar_titles_from_the_same_source_do_not_merge():
+    items = [
+        item("Ep 41: Jensen Huang on the future of AI compute", "Podcast RSS", "https://podcast.example.com/41"),
+        item("Ep 42: Jensen Huang on the future of AI compute", "Podcast RSS", "https://podcast.example.com/42"),
+    ]
+
+    assert clusters(items) == [[0], [1]]
+
+def test_different_part_numbers_do_not_merge():
+    items = [
+        item("Jensen Huang on the future of AI compute, Part 1", "Podcast RSS", "https://podcast.example.com/1"),
+        item("Jensen Huang on the future of AI compute, Part 2", "Podcast YouTube", "https://www.youtube.com/watch?v=p2",
+             source_type="youtube"),
+    ]
+
+    assert clusters(items) == [[0], [1]]
+
+def test_title_match_outside_the_window_does_not_merge():
+    items = [
+        item("Jensen Huang on the future of AI compute", "Podcast RSS", "https://podcast.example.com/1"),
+        item("Jensen Huang on the future of AI compute", "Podcast YouTube", "https://www.youtube.com/watch?v=x",
+             published_at="2024-06-10T12:00:00+00:00", source_type="youtube"),
+    ]
+
+    assert clusters(items) == [[0], [1]]
+
+def test_title_match_never_joins_two_items_of_one_source():
+    # 两个来源相同的条目不能通过第三个来源的条目间接合并
+    items = [
+        item("Jensen Huang on the future of AI compute", "Podcast RSS", "https://podcast.example.com/a"),
+        item("Jensen Huang on the future of AI compute", "Podcast YouTube", "https://www.youtube.com/watch?v=y",
+             source_type="youtube"),
+        item("Jensen Huang on the future of AI compute", "Podcast RSS", "https://podcast.example.com/b"),
+    ]
+
+    assert clusters(items) == [[0, 1], [2]]
+
+def test_short_titles_are_not_fuzzy_matched():
+    items = [
+        item("Weekly Update", "Blog", "https://blog.example.com/1"),
+        item("Weekly Update", "Newsletter", "https://news.example.com/1"),
+    ]
+
+    assert clusters(items) == [[0], [1]]
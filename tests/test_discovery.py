@@ -0,0 +1,63 @@
+import io
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import discovery
+
+SOURCE = {"name": "Test Feed"}
+
+class FakeResponse:
+    def __init__(self, body):
+        self.raw = io.BytesIO(body)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def rss(entries):
+    items = []
+    for index, age_hours in enumerate(entries):
+        date = ""
+        if age_hours is not None:
+            published = datetime.now(timezone.utc) - timedelta(hours=age_hours)
+            date = f"<pubDate>{format_datetime(published)}</pubDate>"
+        items.append(
+            f"<item><title>Post {index}</title><link>https://example.com/{index}</link>"
+            f"<guid>https://example.com/{index}</guid>{date}"
+            f"<description>{'x' * 200}</description></item>"
+        )
+    return f'<?xml version="1.0"?><rss><channel><title>T</title>{"".join(items)}</channel></rss>'.encode()
+
+def titles(posts):
+    return [post["title"] for post in posts]
+
+def test_newest_first_feed_stops_reading_after_old_entries():
+    body = rss([1, 2] + [1000 + hours for hours in range(500)])
+    response = FakeResponse(body)
+
+    posts = discovery.parse_feed_stream(response, SOURCE, "https://example.com/feed")
+
+    assert titles(posts) == ["Post 0", "Post 1"]
+    assert response.raw.tell() < len(body)
+    assert response.closed
+
+def test_oldest_first_feed_is_read_to_the_end():
+    body = rss([2000, 1500, 1000, 900, 800, 2, 1])
+
+    posts = discovery.parse_feed_stream(FakeResponse(body), SOURCE, "https://example.com/feed")
+
+    assert titles(posts) == ["Post 5", "Post 6"]
+
+def test_undated_entries_do_not_count_as_old():
+    body = rss([1, None, None, None, 2])
+
+    posts = discovery.parse_feed_stream(FakeResponse(body), SOURCE, "https://example.com/feed")
+
+    assert titles(posts) == ["Post 0", "Post 4"]
+
+def test_invalid_xml_falls_back_to_feedparser():
+    body = rss([1]).replace(b"<title>Post 0</title>", b"<title>Post 0&nbsp;</title>")
+
+    posts = discovery.parse_feed_stream(FakeResponse(body), SOURCE, "https://example.com/feed")
+
+    assert len(posts) == 1
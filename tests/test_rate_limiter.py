@@ -0,0 +1,65 @@
+import pytest
+
+import rate_limiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+def test_burst_within_capacity_does_not_wait(clock):
+    bucket = rate_limiter.TokenBucket(60, capacity=3)
+
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+def test_reservations_beyond_capacity_queue_in_arrival_order(clock):
+    bucket = rate_limiter.TokenBucket(60, capacity=1)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+
+def test_bucket_refills_over_time_up_to_capacity(clock):
+    bucket = rate_limiter.TokenBucket(60, capacity=2)
+    bucket.reserve(2)
+
+    clock.now += 1.0
+    assert bucket.wait_time(2) == pytest.approx(1.0)
+    clock.now += 60.0
+    assert bucket.wait_time(2) == 0.0
+    assert bucket.level == pytest.approx(2.0)
+
+def test_wait_time_does_not_reserve(clock):
+    bucket = rate_limiter.TokenBucket(60, capacity=1)
+
+    assert bucket.wait_time() == 0.0
+    assert bucket.wait_time() == 0.0
+    assert bucket.reserve() == 0.0
+
+def test_block_pauses_the_bucket_and_drops_the_burst(clock):
+    bucket = rate_limiter.TokenBucket(60, capacity=5)
+    bucket.block(10)
+
+    assert bucket.level == 0.0
+    assert bucket.reserve() == pytest.approx(10.0)
+    assert bucket.wait_time() == pytest.approx(10.0)
+    clock.now += 10.0
+    assert bucket.wait_time() == 0.0
+
+def test_adjust_returns_overestimated_tokens(clock):
+    limiter = rate_limiter.RateLimiter("test", rpm=60, tpm=6000)
+    limiter.tokens.reserve(6000)
+
+    limiter.record_tokens(estimated=6000, actual=1000)
+
+    assert limiter.tokens.level == pytest.approx(5000)
+    assert limiter.wait_time(tokens=5000) == 0.0
+    assert limiter.wait_time(tokens=6000) == pytest.approx(10.0)
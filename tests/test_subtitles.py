@@ -0,0 +1,50 @@
+import json
+
+import subtitles
+
+def test_rolling_vtt_cues_emit_each_word_once():
+    payload = "\n".join([
+        "WEBVTT",
+        "Kind: captions",
+        "",
+        "00:00:00.000 --> 00:00:02.000",
+        "hello <c>world</c>",
+        "",
+        "00:00:02.000 --> 00:00:04.000",
+        "hello world",
+        "how are",
+        "",
+        "00:00:04.000 --> 00:00:06.000",
+        "how are",
+        "you &amp; me",
+        "",
+    ])
+
+    assert subtitles.subtitles_to_text(payload) == "hello world how are you & me"
+
+def test_repeated_words_that_are_not_an_overlap_are_kept():
+    payload = "WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nyes\n\n00:00:01.000 --> 00:00:02.000\nno yes\n"
+
+    assert subtitles.subtitles_to_text(payload) == "yes no yes"
+
+def test_synthetic_rolling_captions_round_trip():
+    text = subtitles.subtitles_to_text(subtitles.synthetic_rolling_vtt(0.05))
+    words = text.split()
+
+    assert words == [f"w{index}" for index in range(len(words))]
+    assert len(words) == 90 * 6
+
+def test_json3_events():
+    payload = json.dumps({"events": [
+        {"segs": [{"utf8": "first "}, {"utf8": "line"}]},
+        {"segs": [{"utf8": "\n"}], "aAppend": 1},
+        {"segs": [{"utf8": "and two"}]},
+    ]})
+
+    assert subtitles.detect_format(payload) == "json3"
+    assert subtitles.subtitles_to_text(payload) == "first line and two"
+
+def test_srv3_cues():
+    payload = '<?xml version="1.0"?><timedtext><body><p t="0">one two</p><p t="1">two three</p></body></timedtext>'
+
+    assert subtitles.subtitles_to_text(payload, "srv3") == "one two three"
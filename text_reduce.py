@@ -0,0 +1,134 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符大约 1 字 1 token，其余文本约 4 字符 1 token
+_CJK_RE = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+# Firecrawl Markdown 噪音
+_IMAGE_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_BARE_URL_RE = re.compile(r'<?https?://\S+>?')
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+# 只匹配整行的样板文字 (订阅、分享按钮、评论数、版权声明等)，正文中以这些词开头的句子不受影响
+_BOILERPLATE_RE = re.compile(
+    r'^\W*(?:'
+    r'(?:subscribe|subscribe now|subscribed|sign up|sign in|log in|share|share this post|restack|like|'
+    r'\d+\s*(?:likes?|comments?|restacks?|shares?)|comments?|leave a comment|read more|skip to content|'
+    r'back to top|follow us(?: on \w+)?|download the app|listen on (?:apple podcasts|spotify|youtube)|'
+    r'privacy policy|terms of service|cookie (?:policy|settings)|accept (?:all )?cookies)'
+    r'|(?:©|copyright\s*(?:©|\(c\)|\d{4})).*|.*all rights reserved'
+    r')\W*$',
+    re.IGNORECASE
+)
+
+def count_tokens(text):
+    """
+    Estimate the Gemini token count of text without a network call.
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4
+
+def _is_nav_line(line):
+    # 导航栏 / 链接列表：一行里大部分都是链接
+    links = _LINK_RE.findall(line)
+    if not links:
+        return False
+    link_text = sum(len(text) for text in links)
+    remaining = len(_LINK_RE.sub('', line).strip(' |*-•·'))
+    return len(links) >= 2 and remaining <= link_text * 0.2
+
+def strip_noise(text, footers=True):
+    """
+    Remove Markdown images, link targets, navigation rows, footers and HTML tags.
+    footers=False keeps short boilerplate-looking lines (transcripts have one caption per line).
+    """
+    kept = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            kept.append('')
+            continue
+        if _is_nav_line(stripped):
+            continue
+        stripped = _IMAGE_RE.sub('', stripped)
+        stripped = _LINK_RE.sub(r'\1', stripped)
+        stripped = _BARE_URL_RE.sub('', stripped)
+        stripped = _HTML_TAG_RE.sub('', stripped).strip()
+        # 短的样板行 (订阅、分享、版权声明等)
+        if not stripped or (footers and len(stripped) < 80 and _BOILERPLATE_RE.match(stripped)):
+            continue
+        kept.append(stripped)
+    return _BLANK_LINES_RE.sub('\n\n', '\n'.join(kept)).strip()
+
+def split_chunks(text, chunk_tokens):
+    """
+    Split text into paragraph-aligned chunks of roughly chunk_tokens tokens.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for paragraph in re.split(r'\n\s*\n|\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        # 超长段落 (如无换行的字幕) 按字符硬切
+        while tokens > chunk_tokens:
+            cut = max(1, int(len(paragraph) * chunk_tokens / tokens))
+            if current:
+                chunks.append('\n'.join(current))
+                current, current_tokens = [], 0
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:]
+            tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+def reduce_content(text, token_budget, chunk_tokens=1000, footers=True):
+    """
+    Clean text and, if it still exceeds token_budget, keep the first and last
+    chunks plus evenly spaced chunks in between so the whole document is covered.
+    """
+    cleaned = strip_noise(text, footers)
+    total = count_tokens(cleaned)
+    if total <= token_budget:
+        return cleaned
+
+    chunks = split_chunks(cleaned, chunk_tokens)
+    sizes = [count_tokens(chunk) for chunk in chunks]
+    keep_count = max(1, min(len(chunks), token_budget // max(1, max(sizes))))
+
+    if keep_count == 1:
+        picked = [0]
+    else:
+        step = (len(chunks) - 1) / (keep_count - 1)
+        picked = sorted({round(i * step) for i in range(keep_count)})
+
+    # 均匀抽样后若仍有余量，按顺序补充其余块
+    used = sum(sizes[i] for i in picked)
+    picked_set = set(picked)
+    for index in range(len(chunks)):
+        if index not in picked_set and used + sizes[index] <= token_budget:
+            picked_set.add(index)
+            used += sizes[index]
+
+    parts = []
+    previous = -1
+    for index in sorted(picked_set):
+        if index != previous + 1:
+            parts.append('[...]')
+        parts.append(chunks[index])
+        previous = index
+    if previous != len(chunks) - 1:
+        parts.append('[...]')
+
+    logger.info(f"Reduced content from {total} to ~{used} tokens ({len(picked_set)}/{len(chunks)} chunks).")
+    return '\n\n'.join(parts)
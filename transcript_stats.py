@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+_stats = None
+_lock = threading.Lock()
+
+def _load():
+    global _stats
+    if _stats is None:
+        try:
+            with open(config.TRANSCRIPT_STATS_PATH, "r", encoding="utf-8") as f:
+                _stats = json.load(f)
+        except FileNotFoundError:
+            _stats = {}
+        except Exception as e:
+            logger.warning(f"Transcript stats unreadable, starting empty: {e}")
+            _stats = {}
+    return _stats
+
+def _save():
+    os.makedirs(os.path.dirname(config.TRANSCRIPT_STATS_PATH), exist_ok=True)
+    tmp_path = config.TRANSCRIPT_STATS_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_stats, f)
+    os.replace(tmp_path, config.TRANSCRIPT_STATS_PATH)
+
+def record(strategy, success, latency, rate_limited=False):
+    """
+    Record the outcome and latency of one transcript strategy attempt.
+    """
+    with _lock:
+        entry = _load().setdefault(strategy, {
+            "attempts": 0, "successes": 0, "total_latency": 0.0, "last_rate_limited_at": None
+        })
+        entry["attempts"] += 1
+        entry["total_latency"] += latency
+        if success:
+            entry["successes"] += 1
+        if rate_limited:
+            entry["last_rate_limited_at"] = time.time()
+        _save()
+
+def recently_rate_limited(strategy):
+    """
+    Whether strategy hit a 429 within TRANSCRIPT_RECENT_429_SECONDS.
+    """
+    with _lock:
+        entry = _load().get(strategy)
+    if not entry or not entry.get("last_rate_limited_at"):
+        return False
+    return time.time() - entry["last_rate_limited_at"] < config.TRANSCRIPT_RECENT_429_SECONDS
+
+def preferred_order(strategies):
+    """
+    Order strategies by smoothed success rate, then by average latency.
+    Strategies without history keep their given order.
+    """
+    with _lock:
+        stats = {name: dict(entry) for name, entry in _load().items()}
+
+    def score(indexed):
+        index, name = indexed
+        entry = stats.get(name)
+        if not entry or not entry["attempts"]:
+            return (-0.5, float("inf"), index)
+        success_rate = (entry["successes"] + 1) / (entry["attempts"] + 2)
+        avg_latency = entry["total_latency"] / entry["attempts"]
+        return (-round(success_rate, 1), avg_latency, index)
+
+    return [name for _, name in sorted(enumerate(strategies), key=score)]